@@ -0,0 +1,103 @@
+import csv
+import io
+from pathlib import Path
+
+from .db import iter_chunks
+
+# 一度に読み出して書き出す行数 (メモリ使用量はこれに比例するだけで全体の件数には依存しない)
+FETCH_SIZE = 2000
+
+FORMATS = ("csv", "ndjson", "parquet")
+COMPRESSIONS = ("none", "gzip", "zstd")
+_SUFFIX = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd compression requires the 'zstandard' package (pip install zstandard)") from None
+    return zstandard
+
+
+def backup_path(outdir: Path, name: str, fmt: str, compression: str = "none") -> Path:
+    """videos + csv + gzip -> outdir/videos.csv.gz"""
+    if fmt == "parquet":
+        # parquet は内部で圧縮するので外側は圧縮しない
+        return outdir / f"{name}.parquet"
+    return outdir / f"{name}.{fmt}{_SUFFIX[compression]}"
+
+
+def open_binary(path: Path, mode: str):
+    """拡張子 (.gz / .zst) に応じて圧縮ストリームを開く"""
+    if path.suffix == ".gz":
+        import gzip  # cli が FORMATS / COMPRESSIONS のためにこのモジュールを読むので遅延させる
+        return gzip.open(path, mode, compresslevel=6)
+    if path.suffix == ".zst":
+        return _zstd().open(path, mode)
+    return open(path, mode)
+
+
+def open_text(path: Path, mode: str = "r"):
+    """CSV 用のテキストストリーム (BOM付きUTF-8。Excel で開けるように)"""
+    return io.TextIOWrapper(open_binary(path, mode + "b"), encoding="utf-8-sig", newline="")
+
+
+def find_input(indir: Path, name: str) -> Path | None:
+    """videos.csv / videos.csv.gz / videos.csv.zst のうち存在するものを返す"""
+    for suffix in ("", ".gz", ".zst"):
+        p = indir / f"{name}.csv{suffix}"
+        if p.exists():
+            return p
+    return None
+
+
+def _write_csv(cur, columns, path):
+    with open_text(path, "w") as f:
+        w = csv.writer(f)
+        w.writerow(columns)
+        n = 0
+        for rows in iter_chunks(cur, FETCH_SIZE):
+            w.writerows(tuple(r) for r in rows)
+            n += len(rows)
+    return n
+
+
+def _write_ndjson(cur, columns, path):
+    import orjson
+    with open_binary(path, "wb") as f:
+        n = 0
+        for rows in iter_chunks(cur, FETCH_SIZE):
+            f.write(b"".join(orjson.dumps(dict(zip(columns, r))) + b"\n" for r in rows))
+            n += len(rows)
+    return n
+
+
+def _write_parquet(cur, columns, path, types):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("parquet export requires the 'pyarrow' package (pip install pyarrow)") from None
+    schema = pa.schema([(c, pa.int64() if types.get(c) == "int" else pa.string()) for c in columns])
+    n = 0
+    # fetchmany のバッチごとに row group を書き出す
+    with pq.ParquetWriter(str(path), schema, compression="zstd") as w:
+        for rows in iter_chunks(cur, FETCH_SIZE):
+            cols = list(zip(*rows))
+            w.write_batch(pa.RecordBatch.from_arrays(
+                [pa.array(cols[i], type=schema.field(i).type) for i in range(len(columns))], schema=schema))
+            n += len(rows)
+    return n
+
+
+def export_query(conn, sql, params, columns, path: Path, fmt: str, types=None) -> int:
+    """SELECT の結果をストリーミングで書き出し、書いた行数を返す"""
+    cur = conn.execute(sql, params)
+    if fmt == "csv":
+        return _write_csv(cur, columns, path)
+    if fmt == "ndjson":
+        return _write_ndjson(cur, columns, path)
+    if fmt == "parquet":
+        return _write_parquet(cur, columns, path, types or {})
+    raise ValueError(f"unknown format: {fmt}")
@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+from .db import get_read_conn, run_db
+from .search import VIDEO_FIELDS
+
+MAX_LIMIT = 1000
+
+
+def last_seq(conn) -> int:
+    # 最新の行がトゥームストーンとして消されていても巻き戻らないように horizon も見る
+    return conn.execute("""
+    SELECT MAX(IFNULL((SELECT MAX(seq) FROM changes), 0), (SELECT horizon FROM changes_state WHERE id = 1))
+    """).fetchone()[0]
+
+
+def _current_seq() -> int:
+    with get_read_conn() as conn:
+        return last_seq(conn)
+
+
+def read_changes(conn, since: int, limit: int = 500) -> dict:
+    """
+    seq が since より後の変更を最大 limit 件返す
+    返却: {"changes": [...], "next": 次に渡す since, "more": 続きがあるか, "reset": 全件取り直しが必要か}
+    各変更は {"seq", "op": "upsert", "video": {..., "tags": [...]}} か {"seq", "op": "delete", "id"}
+    (動画ごとに最新の状態だけを返すので、途中の変更はまとめられる)
+    """
+    conn.execute("BEGIN")
+    horizon = conn.execute("SELECT horizon FROM changes_state WHERE id = 1").fetchone()[0]
+    last = last_seq(conn)
+    # 削除済みの変更より前、または DB が作り直されて seq が巻き戻った場合
+    if since < horizon or since > last:
+        return {"changes": [], "next": last, "more": False, "reset": True}
+    rows = conn.execute(
+        "SELECT seq, video_id FROM changes WHERE seq > ? ORDER BY seq LIMIT ?", (since, limit)).fetchall()
+    if not rows:
+        return {"changes": [], "next": since, "more": False, "reset": False}
+    upto = rows[-1]["seq"]
+    window = "SELECT video_id FROM changes WHERE seq > ? AND seq <= ?"
+    videos = {r["id"]: dict(r) for r in conn.execute(
+        f"SELECT {', '.join(VIDEO_FIELDS)} FROM videos WHERE id IN ({window})", (since, upto))}
+    for v in videos.values():
+        v["tags"] = []
+    for r in conn.execute(
+            f"SELECT video_id, tag FROM video_tags WHERE video_id IN ({window}) ORDER BY video_id, tag",
+            (since, upto)):
+        videos[r["video_id"]]["tags"].append(r["tag"])
+    changes = []
+    for r in rows:
+        v = videos.get(r["video_id"])
+        if v is None:
+            changes.append({"seq": r["seq"], "op": "delete", "id": r["video_id"]})
+        else:
+            changes.append({"seq": r["seq"], "op": "upsert", "video": v})
+    return {"changes": changes, "next": upto, "more": len(rows) == limit, "reset": False}
+
+
+async def wait_for_changes(since: int, timeout: float, poll_interval: float = 0.5) -> bool:
+    """
+    since より新しい変更が入るまで最大 timeout 秒待つ
+    (CLI など別プロセスからの書き込みも拾えるように、MAX(seq) を軽くポーリングする)
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        if await run_db(_current_seq) != since:
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        await asyncio.sleep(min(poll_interval, remaining))
+
+
+def prune_changes(conn, older_than_days: float) -> int:
+    """
+    古いトゥームストーン (削除された動画の行) を消す
+    消した範囲より前の seq を持つクライアントには以後 reset を返す
+    """
+    cutoff = f"-{older_than_days} days"
+    cond = ("changed_at < datetime('now', ?) "
+            "AND NOT EXISTS (SELECT 1 FROM videos v WHERE v.id = changes.video_id)")
+    top = conn.execute(f"SELECT MAX(seq) FROM changes WHERE {cond}", (cutoff,)).fetchone()[0]
+    if top is None:
+        return 0
+    cur = conn.execute(f"DELETE FROM changes WHERE {cond}", (cutoff,))
+    conn.execute("UPDATE changes_state SET horizon = MAX(horizon, ?) WHERE id = 1", (top,))
+    return cur.rowcount
@@ -1,8 +1,12 @@
 import argparse
-from .db import get_conn, init_db
-from .youtube import parse_video_id_from_url, fetch_video_meta
+from .db import get_conn, get_read_conn, init_db, iter_chunks, save_video_metas, rebuild_fts
+from .backup import COMPRESSIONS, FETCH_SIZE, FORMATS
+# youtube (requests / dotenv) やワーカー・バックアップ・サムネイルは使うコマンドの中で import する。
+# list / get / rate / タグ操作をループで呼ぶスクリプトの起動を軽くするため (backend/bench/startup.py で計測)
 import csv
 import os
+import sys
+import time
 from pathlib import Path
 
 
@@ -23,41 +27,76 @@ def cmd_add(args):
 
 def cmd_get(args):
     """1件取得して表示"""
-    with get_conn() as conn:
-        v = conn.execute("SELECT * FROM videos WHERE id=?", (args.id,)).fetchone()
+    from .search import VIDEO_FIELDS
+    with get_read_conn() as conn:
+        v = conn.execute(f"SELECT {', '.join(VIDEO_FIELDS)} FROM videos WHERE id=?", (args.id,)).fetchone()
         if not v:
             print("not found")
             return
         tags = [r["tag"] for r in conn.execute(
             "SELECT tag FROM video_tags WHERE video_id=?", (args.id,)).fetchall()]
-    print({
-        "id": v["id"],
-        "title": v["title"],
-        "thumbnail_url": v["thumbnail_url"],
-        "rating": v["rating"],
-        "note": v["note"],
-        "tags": tags,
-        "created_at": v["created_at"],
-        "updated_at": v["updated_at"],
-    })
-
-
-def cmd_list(_args):
-    """一覧表示 (簡易) """
-    with get_conn() as conn:
-        rows = conn.execute(
-            "SELECT id, title, rating, created_at FROM videos ORDER BY created_at DESC").fetchall()
-    for r in rows:
-        print(f"{r['created_at']}  {r['id']}  {r['rating'] or '-'}  {r['title'] or ''}")
+    import json
+    print(json.dumps({**dict(v), "tags": tags}, ensure_ascii=False, indent=None if args.compact else 2))
+
+
+LIST_FORMATS = ("text", "tsv", "ndjson")
+
+
+def _tsv_cell(v) -> str:
+    # 値の中のタブ/改行はエスケープして1行1件を保つ (cut / awk にそのまま渡せるように)
+    if v is None:
+        return ""
+    return str(v).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _list_lines(fmt, cols, rows):
+    if fmt == "ndjson":
+        import json
+        return (json.dumps({c: r[c] for c in cols}, ensure_ascii=False) for r in rows)
+    if fmt == "tsv":
+        return ("\t".join(_tsv_cell(r[c]) for c in cols) for r in rows)
+    return (f"{r['created_at']}  {r['id']}  {r['rating'] or '-'}  {r['title'] or ''}" for r in rows)
+
+
+def cmd_list(args):
+    """一覧表示。fetchmany で少しずつ読んで書き出すので件数が多くてもメモリは一定"""
+    from .search import build_list_query, parse_fields
+    try:
+        cols = parse_fields(args.fields) if args.format != "text" else ["id", "title", "rating", "created_at"]
+        # API の GET /videos と同じ組み立て (キーセットのカーソルは使わず LIMIT / OFFSET で切る)
+        sql, params, _ = build_list_query(
+            query=args.query, tags_all=args.tag, tags_any=args.any_tag, tags_not=args.not_tag,
+            order=args.order, fields=cols)
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(2)
+    if args.limit is not None or args.offset:
+        sql += " LIMIT ? OFFSET ?"
+        params = [*params, -1 if args.limit is None else args.limit, args.offset]
+
+    out = sys.stdout
+    try:
+        if args.format == "tsv" and not args.no_header:
+            out.write("\t".join(cols) + "\n")
+        with get_read_conn() as conn:
+            cur = conn.execute(sql, params)
+            while rows := cur.fetchmany(FETCH_SIZE):
+                out.write("".join(line + "\n" for line in _list_lines(args.format, cols, rows)))
+        out.flush()
+    except BrokenPipeError:
+        # `favtube list | head` で読み手が先に閉じた場合。終了時の flush で再度出ないように差し替える
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
 
 # --- URLから追加 (メタ自動取得) ---
 
 
 def cmd_add_url(args):
-    vid = parse_video_id_from_url(args.url)
+    from .videoid import canonical_video_id
+    vid = canonical_video_id(args.url)
     if not vid:
         print("ERROR: URL から videoId を抽出できませんでした。")
         return
+    from .youtube import fetch_video_meta
     init_db()
     # メタ取得
     try:
@@ -89,9 +128,106 @@ def cmd_add_url(args):
         f"Saved by URL: {vid} | title={meta['title']!r} | rate={args.rate or '-'} | tags={args.tags or '-'}")
 
 
+def cmd_import_urls(args):
+    """貼り付けた URL の一覧 (空白/改行区切り) を videoId にそろえて一括登録し、メタ取得ジョブに積む"""
+    from .videoid import resolve_ids
+    t0 = time.perf_counter()
+    f = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8-sig")
+    try:
+        per_url, ids = resolve_ids(token for line in f for token in line.split())
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    n, invalid = len(per_url), per_url.count(None)
+    parsed = time.perf_counter() - t0
+    print(f"Parsed {n} URLs -> {len(ids)} unique ids ({invalid} invalid) "
+          f"in {parsed:.2f}s ({n / max(parsed, 1e-9):,.0f} URLs/s)")
+    if args.dry_run or not ids:
+        return
+
+    from .worker import enqueue_meta
+    init_db()
+    with get_conn() as conn:
+        conn.execute("CREATE TEMP TABLE import_urls(id TEXT PRIMARY KEY) WITHOUT ROWID")
+        try:
+            conn.executemany("INSERT INTO temp.import_urls(id) VALUES(?)", ((v,) for v in ids))
+            added = conn.execute("""
+            INSERT INTO videos(id) SELECT id FROM temp.import_urls WHERE true ON CONFLICT(id) DO NOTHING
+            """).rowcount
+            queued = 0
+            if not args.no_fetch:
+                # タイトル未取得のもの (今回追加した分を含む) はワーカーが後から埋める
+                queued = enqueue_meta(conn, [r[0] for r in conn.execute("""
+                SELECT u.id FROM temp.import_urls u JOIN videos v ON v.id = u.id WHERE v.title IS NULL
+                """)])
+        finally:
+            conn.execute("DROP TABLE IF EXISTS temp.import_urls")
+    print(f"Added {added} videos ({len(ids) - added} already registered), queued {queued} meta jobs "
+          f"in {time.perf_counter() - t0:.2f}s")
+
+
+def _merge_video(conn, src: str, dst: str):
+    """src の動画を dst にまとめる (dst の値を優先し、空の項目だけ埋める。タグは和集合)"""
+    conn.execute("""
+    UPDATE videos SET
+        title = COALESCE(title, (SELECT title FROM videos WHERE id = :src)),
+        thumbnail_url = COALESCE(thumbnail_url, (SELECT thumbnail_url FROM videos WHERE id = :src)),
+        rating = COALESCE(rating, (SELECT rating FROM videos WHERE id = :src)),
+        note = COALESCE(note, (SELECT note FROM videos WHERE id = :src)),
+        created_at = MIN(created_at, COALESCE((SELECT created_at FROM videos WHERE id = :src), created_at)),
+        updated_at = datetime('now')
+    WHERE id = :dst
+    """, {"src": src, "dst": dst})
+    conn.execute("""
+    INSERT OR IGNORE INTO video_tag_links(video_pk, tag_id)
+    SELECT (SELECT pk FROM videos WHERE id = :dst), tag_id FROM video_tag_links
+    WHERE video_pk = (SELECT pk FROM videos WHERE id = :src)
+    """, {"src": src, "dst": dst})
+    # タグのリンクは連鎖削除され、変更ログには src のトゥームストーンが残る
+    conn.execute("DELETE FROM videos WHERE id = ?", (src,))
+
+
+def cmd_dedupe(args):
+    """id が URL や前後に空白の付いた形で登録された動画を videoId にそろえ、重複をまとめる"""
+    from .videoid import canonical_video_id
+    init_db()
+    with get_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        moves = [(r[0], canonical_video_id(r[0])) for r in conn.execute("SELECT id FROM videos")]
+        moves = [(old, new) for old, new in moves if new != old]
+        renamed = merged = 0
+        for old, new in moves:
+            if new is None:
+                print(f"  skip (not a YouTube id/URL): {old!r}")
+                continue
+            if conn.execute("SELECT 1 FROM videos WHERE id = ?", (new,)).fetchone():
+                _merge_video(conn, old, new)
+                merged += 1
+                action = "merge"
+            else:
+                # pk はそのままなのでタグや全文検索の行は付け替え不要
+                conn.execute("UPDATE videos SET id = ?, updated_at = datetime('now') WHERE id = ?", (new, old))
+                # 同期クライアントが古い id を消せるようにトゥームストーンを残す
+                conn.execute("DELETE FROM changes WHERE video_id = ?", (old,))
+                conn.execute("INSERT INTO changes(video_id) VALUES (?)", (old,))
+                renamed += 1
+                action = "rename"
+            for table in ("thumbnails", "meta_jobs"):
+                conn.execute(f"UPDATE OR IGNORE {table} SET video_id = ? WHERE video_id = ?", (new, old))
+                conn.execute(f"DELETE FROM {table} WHERE video_id = ?", (old,))
+            if args.verbose:
+                print(f"  {action}: {old!r} -> {new}")
+        if args.dry_run:
+            conn.rollback()
+    prefix = "[dry-run] " if args.dry_run else ""
+    print(f"{prefix}Renamed {renamed}, merged {merged} duplicate videos")
+
+
 def cmd_fetch_meta(args):
+    from .youtube import fetch_video_meta
+    init_db()
     try:
-        meta = fetch_video_meta(args.id)
+        meta = fetch_video_meta(args.id, refresh=True)
     except Exception as e:
         print(f"ERROR: {e}")
         return
@@ -107,6 +243,32 @@ def cmd_fetch_meta(args):
     print(f"Updated meta: {args.id} -> {meta['title']!r}")
 
 
+def cmd_refresh_meta(args):
+    """全件 (または指定ID) のメタ情報を50件単位のバッチでまとめて更新"""
+    from .youtube import fetch_video_meta_batch
+    init_db()
+    if args.ids:
+        ids = args.ids
+    else:
+        sql = "SELECT id FROM videos"
+        if args.missing_only:
+            sql += " WHERE title IS NULL OR thumbnail_url IS NULL"
+        with get_read_conn() as conn:
+            ids = [r["id"] for r in conn.execute(sql)]
+    if not ids:
+        print("Nothing to refresh.")
+        return
+    try:
+        metas = fetch_video_meta_batch(ids, max_workers=args.workers, refresh=not args.use_cache)
+    except Exception as e:
+        print(f"ERROR: {e}")
+        return
+    with get_conn() as conn:
+        changed = save_video_metas(conn, metas.values())
+    missing = len(set(ids) - metas.keys())
+    print(f"Refreshed meta: requested={len(ids)} fetched={len(metas)} changed={changed} not_found={missing}")
+
+
 def cmd_rate(args):
     if not (1 <= args.rating <= 5):
         print("ERROR: rating must be between 1..5")
@@ -136,85 +298,340 @@ def cmd_tag_rm(args):
     print(f"Tag removed: {args.id} -{args.tag}")
 
 
-# ---- CSV エクスポート ----
+def cmd_thumbs_prefetch(args):
+    """サムネイルを一括でローカルに取得し、縮小版を作っておく"""
+    from .thumbs import THUMBS_DIR, prefetch as prefetch_thumbnails
+    init_db()
+    counts = prefetch_thumbnails(args.ids or None, workers=args.workers, variants=not args.no_variants,
+                                 progress=lambda msg: print(msg, file=sys.stderr))
+    print(f"Thumbnails: fetched={counts['fetched']} failed={counts['failed']} "
+          f"variants={counts['variants']} -> {THUMBS_DIR}")
+
+
+def cmd_changes_prune(args):
+    """変更ログから古いトゥームストーンを消す"""
+    from .changes import prune_changes
+    init_db()
+    with get_conn() as conn:
+        n = prune_changes(conn, args.days)
+    print(f"Pruned change log: {n} tombstones older than {args.days} days")
+
+
+def cmd_similar_refresh(args):
+    """似た動画の上位K件を計算し直す (既定ではタグ/★が変わった分だけ)"""
+    from .similar import refresh_similar
+    init_db()
+    t0 = time.perf_counter()
+    try:
+        result = refresh_similar(full=args.full)
+    except RuntimeError as e:
+        print(f"ERROR: {e}")
+        return
+    print(f"Similar ({result['mode']}): {result['recomputed']} videos, {result['rows']} rows "
+          f"in {time.perf_counter() - t0:.2f}s")
+
+
+def cmd_fts_rebuild(_args):
+    """全文検索インデックスを作り直す"""
+    init_db()
+    with get_conn() as conn:
+        n = rebuild_fts(conn)
+    print(f"Rebuilt search index: {n} videos")
+
+
+def cmd_stats(args):
+    """ライブラリの統計を表示 (トリガーで集計済みの値を引くだけ)"""
+    from .stats import read_stats
+    init_db()
+    with get_read_conn() as conn:
+        st = read_stats(conn, tags=args.tags, days=args.days)
+    if args.json:
+        import json
+        print(json.dumps(st, ensure_ascii=False, indent=2))
+        return
+    avg = f"{st['rating_avg']:.2f}" if st["rating_avg"] is not None else "-"
+    print(f"Videos: {st['videos']} (rated {st['rated']}, unrated {st['unrated']}, avg ★{avg})")
+    print(f"Tags: {st['tags']} ({st['tag_links']} taggings)")
+    width = max([r["count"] for r in st["ratings"]] + [1])
+    for r in st["ratings"]:
+        print(f"  ★{r['rating']} {r['count']:8d}  {'#' * round(40 * r['count'] / width)}")
+    if st["top_tags"]:
+        print("--- top tags")
+        for t in st["top_tags"]:
+            print(f"  {t['count']:8d}  {t['tag']}")
+    if st["added_per_day"]:
+        print(f"--- added per day (last {args.days} days, UTC)")
+        for d in st["added_per_day"]:
+            print(f"  {d['day']}  {d['count']}")
+
+
+def cmd_stats_rebuild(_args):
+    """統計とタグ件数を数え直す (トリガーを通さずに書き換えた場合など、ずれたときに)"""
+    from .db import rebuild_stats, rebuild_tag_counts
+    from .stats import read_stats
+    init_db()
+    t0 = time.perf_counter()
+    with get_conn() as conn:
+        before = read_stats(conn, tags=0, days=0)
+        rebuild_tag_counts(conn)
+        days = rebuild_stats(conn)
+        after = read_stats(conn, tags=0, days=0)
+    drift = {k: (before[k], after[k]) for k in after if before[k] != after[k]}
+    print(f"Rebuilt stats: {after['videos']} videos, {days} days in {time.perf_counter() - t0:.2f}s")
+    for k, (old, new) in drift.items():
+        print(f"  fixed {k}: {old} -> {new}")
+
+
+def cmd_worker(args):
+    """メタ情報取得ジョブを処理するワーカーを動かす (Ctrl+C で停止)"""
+    from .worker import enqueue_meta, pending_jobs, run_worker
+    init_db()
+    if args.enqueue_missing:
+        with get_conn() as conn:
+            ids = [r["id"] for r in conn.execute(
+                "SELECT id FROM videos WHERE title IS NULL OR thumbnail_url IS NULL")]
+            n = enqueue_meta(conn, ids)
+        print(f"Enqueued: {n}")
+    print(f"Pending jobs: {pending_jobs()} (rate={args.rate}/s)")
+    try:
+        run_worker(once=args.once, rate=args.rate, burst=args.burst)
+    except KeyboardInterrupt:
+        pass
+    print(f"Worker stopped. Pending jobs: {pending_jobs()}")
+
+
+def cmd_serve(args):
+    """
+    API サーバーを起動する。--workers が 2 以上なら uvicorn のワーカープロセスを並べる
+    (各プロセスは読み取り専用の接続プールを持ち、書き込みは SQLite のロックで1本ずつ)
+    """
+    import threading
+    import uvicorn
+    # スキーマの作成/マイグレーションは子プロセスを起動する前にここで1回だけ
+    init_db()
+    os.environ["FAVTUBE_INIT_DB"] = "0"
+    stop = threading.Event()
+    if args.workers > 1:
+        # メタ取得ワーカーと似た動画の更新は親プロセスで1本だけ動かす
+        # (子プロセスごとに動かすと YouTube へのレートが workers 倍になる)
+        from .main import start_background
+        start_background(stop)
+        os.environ["FAVTUBE_BACKGROUND_TASKS"] = "0"
+    try:
+        uvicorn.run(f"{__package__}.main:app", host=args.host, port=args.port, workers=args.workers)
+    finally:
+        stop.set()
+
+
+# ---- エクスポート (CSV / NDJSON / Parquet) ----
 def cmd_export_csv(args):
+    from .backup import backup_path, export_query
     outdir = Path(args.dir)
     outdir.mkdir(parents=True, exist_ok=True)
+    fmt = args.format
+    compression = args.compress
+    where = ""
+    params = []
+    if args.since:
+        # 差分エクスポート: since 以降に更新された動画 (タグ操作も updated_at を更新する)
+        where = " WHERE v.updated_at >= ?"
+        params.append(args.since)
+
+    vids_path = backup_path(outdir, "videos", fmt, compression)
+    tags_path = backup_path(outdir, "video_tags", fmt, compression)
+    t0 = time.perf_counter()
+    try:
+        with get_read_conn() as conn:
+            # 2つのファイルを同じスナップショットから書き出す (読み取りトランザクションなので API の書き込みは待たせない)
+            conn.execute("BEGIN")
+            n_videos = export_query(
+                conn,
+                "SELECT v.id,v.title,v.thumbnail_url,v.rating,v.note,v.created_at,v.updated_at FROM videos v"
+                + where + " ORDER BY IFNULL(v.created_at, '') DESC",
+                params,
+                ["id", "title", "thumbnail_url", "rating", "note", "created_at", "updated_at"],
+                vids_path, fmt, types={"rating": "int"})
+            n_tags = export_query(
+                conn,
+                "SELECT t.video_id, t.tag FROM video_tags t"
+                + (" JOIN videos v ON v.id = t.video_id" + where if where else "")
+                + " ORDER BY t.video_id, t.tag",
+                params, ["video_id", "tag"], tags_path, fmt)
+    except RuntimeError as e:
+        print(f"ERROR: {e}")
+        return
 
-    # videos.csv
-    with get_conn() as conn, open(outdir / "videos.csv", "w", newline="", encoding="utf-8-sig")as f:
-        w = csv.writer(f)
-        w.writerow(["id", "title", "thumbnail_url", "rating", "note", "created_at", "updated_at"])
-        for r in conn.execute("SELECT id,title,thumbnail_url,rating,note,created_at,updated_at FROM videos ORDER BY created_at DESC"):
-            w.writerow([r["id"], r["title"], r["thumbnail_url"], r["rating"],
-                       r["note"], r["created_at"], r["updated_at"]])
+    print(f"Exported {n_videos} videos, {n_tags} tags in {time.perf_counter() - t0:.2f}s")
+    print(f"Exported to: {vids_path}, {tags_path}")
 
-    # video_tags.csv
-    with get_conn() as conn, open(outdir / "video_tags.csv", "w", newline="", encoding="utf-8-sig") as f:
-        w = csv.writer(f)
-        w.writerow(["video_id", "tag"])
-        for r in conn.execute("SELECT video_id, tag FROM video_tags ORDER BY video_id, tag"):
-            w.writerow([r["video_id"], r["tag"]])
+# ---- CSV インポート ----
 
-    print(f"Exported to: {outdir}\\videos.csv, {outdir}\\video_tags.csv")
 
-# ---- CSV インポート ----
+class _Progress:
+    """stderr に件数と rows/s を上書き表示する"""
+
+    def __init__(self, label):
+        self.label = label
+        self.n = 0
+        self.t0 = time.perf_counter()
+
+    def add(self, k):
+        self.n += k
+        print(f"\r{self.label}: {self.n} rows ({self.rate():,.0f} rows/s)", end="", file=sys.stderr, flush=True)
+
+    def rate(self):
+        return self.n / max(time.perf_counter() - self.t0, 1e-9)
+
+    def done(self):
+        print(f"\r{self.label}: {self.n} rows ({self.rate():,.0f} rows/s)", file=sys.stderr, flush=True)
+
+
+def _video_rows(reader):
+    from .videoid import canonical_video_id
+    for row in reader:
+        vid = (row.get("id") or "").strip()
+        # URL のまま書かれていても videoId にそろえる
+        vid = canonical_video_id(vid) or vid
+        if not vid:
+            continue
+        rating = row.get("rating")
+        rating_val = int(rating) if (rating and rating.strip().isdigit())else None
+        yield (
+            vid, row.get("title") or None, row.get("thumbnail_url") or None,
+            rating_val, row.get("note") or None,
+            row.get("created_at") or None,  # created_atは渡されれば使う
+            row.get("updated_at") or None,
+        )
+
+
+def _tag_rows(reader):
+    from .videoid import canonical_video_id
+    for row in reader:
+        vid = (row.get("video_id") or "").strip()
+        vid = canonical_video_id(vid) or vid
+        tag = (row.get("tag") or "").strip()
+        if vid and tag:
+            yield (vid, tag)
+
+
+def _stage_csv(conn, path, table, columns, rows_fn, chunk_size):
+    """CSV をチャンクごとに executemany で一時テーブルへ流し込む"""
+    from .backup import open_text
+    progress = _Progress(f"staging {path.name}")
+    sql = f"INSERT INTO temp.{table}({','.join(columns)}) VALUES({','.join('?' * len(columns))})"
+    with open_text(path) as f:
+        for chunk in iter_chunks(rows_fn(csv.DictReader(f)), chunk_size):
+            conn.executemany(sql, chunk)
+            progress.add(len(chunk))
+    progress.done()
+    return progress.n
+
+
+def _import_diff(conn):
+    """一時テーブルと現在のDBを比べて、取り込んだ場合の差分件数を返す"""
+    conn.execute("CREATE INDEX temp.import_videos_id ON import_videos(id)")
+
+    def q(sql):
+        return conn.execute(sql).fetchone()[0]
+
+    total = q("SELECT COUNT(DISTINCT id) FROM temp.import_videos")
+    new = q("""SELECT COUNT(DISTINCT s.id) FROM temp.import_videos s
+               WHERE NOT EXISTS (SELECT 1 FROM videos v WHERE v.id = s.id)""")
+    changed = q("""SELECT COUNT(DISTINCT s.id) FROM temp.import_videos s JOIN videos v ON v.id = s.id
+                   WHERE s.title IS NOT v.title OR s.thumbnail_url IS NOT v.thumbnail_url
+                      OR s.rating IS NOT v.rating OR s.note IS NOT v.note""")
+    tags_new = q("""SELECT COUNT(*) FROM (SELECT DISTINCT video_id, tag FROM temp.import_tags) s
+                    WHERE (EXISTS (SELECT 1 FROM videos v WHERE v.id = s.video_id)
+                           OR EXISTS (SELECT 1 FROM temp.import_videos i WHERE i.id = s.video_id))
+                      AND NOT EXISTS (SELECT 1 FROM video_tags t WHERE t.video_id = s.video_id AND t.tag = s.tag)""")
+    tags_skipped = q("""SELECT COUNT(*) FROM temp.import_tags s
+                        WHERE NOT EXISTS (SELECT 1 FROM videos v WHERE v.id = s.video_id)
+                          AND NOT EXISTS (SELECT 1 FROM temp.import_videos i WHERE i.id = s.video_id)""")
+    return {
+        "videos_new": new,
+        "videos_changed": changed,
+        "videos_unchanged": total - new - changed,
+        "tags_new": tags_new,
+        "tags_skipped": tags_skipped,
+    }
 
 
 def cmd_import_csv(args):
+    from .backup import find_input
     indir = Path(args.dir)
-    vids_csv = indir / "videos.csv"
-    tags_csv = indir / "video_tags.csv"
-    if not vids_csv.exists():
-        print(f"ERROR: {vids_csv} not found")
+    # export の gzip / zstd 圧縮CSVもそのまま読める
+    vids_csv = find_input(indir, "videos")
+    tags_csv = find_input(indir, "video_tags")
+    if vids_csv is None:
+        print(f"ERROR: {indir / 'videos.csv'} not found")
         return
+    init_db()
+    t0 = time.perf_counter()
 
     with get_conn() as conn:
-        # videos.csv
-        with open(vids_csv, newline="", encoding="utf-8-sig")as f:
-            reader = csv.DictReader(f)
-            n = 0
-            for row in reader:
-                rating = row.get("rating")
-                rating_val = int(rating) if (rating and rating.strip().isdigit())else None
+        # 全体を1トランザクションで流し、外部キーの検査はコミット時まで遅らせる
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("PRAGMA defer_foreign_keys = ON")
+        conn.execute("""CREATE TEMP TABLE import_videos(
+            id TEXT, title TEXT, thumbnail_url TEXT, rating INTEGER, note TEXT, created_at TEXT, updated_at TEXT)""")
+        conn.execute("CREATE TEMP TABLE import_tags(video_id TEXT, tag TEXT)")
+        try:
+            n_videos = _stage_csv(conn, vids_csv, "import_videos",
+                                  ["id", "title", "thumbnail_url", "rating", "note", "created_at", "updated_at"],
+                                  _video_rows, args.chunk_size)
+            n_tags = 0
+            if tags_csv is not None:
+                n_tags = _stage_csv(conn, tags_csv, "import_tags", ["video_id", "tag"], _tag_rows, args.chunk_size)
+
+            if args.dry_run:
+                d = _import_diff(conn)
+                print(f"[dry-run] videos: {n_videos} rows -> new {d['videos_new']}, changed {d['videos_changed']}, "
+                      f"unchanged {d['videos_unchanged']}")
+                print(f"[dry-run] tags: {n_tags} rows -> new {d['tags_new']}, "
+                      f"skipped without video {d['tags_skipped']}")
+                conn.rollback()
+                return
+
+            conn.execute("""
+            INSERT INTO videos(id,title,thumbnail_url,rating,note,created_at,updated_at)
+            SELECT id, title, thumbnail_url, rating, note,
+                   COALESCE(created_at, datetime('now')), COALESCE(updated_at, datetime('now'))
+            FROM temp.import_videos WHERE true
+            ON CONFLICT(id) DO UPDATE SET
+              title=excluded.title,
+              thumbnail_url=excluded.thumbnail_url,
+              rating=excluded.rating,
+              note=excluded.note,
+              updated_at=datetime('now')
+            """)
+            print(f"Imported videos: {n_videos}")
+
+            if n_tags:
+                # videos に存在しないタグ行は集合演算でまとめて除外
+                skipped = conn.execute("""
+                SELECT COUNT(*) FROM temp.import_tags s
+                WHERE NOT EXISTS (SELECT 1 FROM videos v WHERE v.id = s.video_id)
+                """).fetchone()[0]
+                # ビュー (video_tags) を経由せず、タグ辞書と整数キーの表に直接入れる
                 conn.execute("""
-                INSERT INTO videos(id,title,thumbnail_url,rating,note,created_at,updated_at)
-                VALUES(?,?,?,?,?,?,?)
-                ON CONFLICT(id) DO UPDATE SET
-                  title=excluded.title,
-                  thumbnail_url=excluded.thumbnail_url,
-                  rating=excluded.rating,
-                  note=excluded.note,
-                  updated_at=datetime('now')
-                """, (
-                    row.get("id"), row.get("title"), row.get("thumbnail_url"),
-                    rating_val, row.get("note"),
-                    row.get("created_at") or None,  # created_atは渡されれば使う
-                    row.get("updated_at") or None
-                ))
-                n += 1
-            print(f"Imported videos: {n}")
-
-        # video_tags.csv
-        if tags_csv.exists():
-            with open(tags_csv, newline="", encoding="utf-8-sig")as f:
-                reader = csv.DictReader(f)
-                m = 0
-                skipped = 0
-                for row in reader:
-                    vid = row.get("video_id")
-                    tag = (row.get("tag") or "").strip()
-                    if not vid or not tag:
-                        continue
-                    # videos に存在しなければスキップ
-                    v = conn.execute("SELECT 1 FROM videos WHERE id=?", (vid,)).fetchone()
-                    if not v:
-                        skipped += 1
-                        continue
-                    conn.execute(
-                        "INSERT OR IGNORE INTO video_tags(video_id, tag) VALUES(?,?)", (vid, tag))
-                    m += 1
-                print(f"Imported tags: {m} (skipped without video: {skipped})")
+                INSERT OR IGNORE INTO tags(name)
+                SELECT DISTINCT s.tag FROM temp.import_tags s JOIN videos v ON v.id = s.video_id
+                """)
+                inserted = conn.execute("""
+                INSERT OR IGNORE INTO video_tag_links(video_pk, tag_id)
+                SELECT v.pk, t.id FROM temp.import_tags s
+                JOIN videos v ON v.id = s.video_id
+                JOIN tags t ON t.name = s.tag
+                """).rowcount
+                print(f"Imported tags: {n_tags - skipped} (new: {inserted}, skipped without video: {skipped})")
+        finally:
+            # (dry-run やエラー時はロールバックで一時テーブルごと消える)
+            conn.execute("DROP TABLE IF EXISTS temp.import_videos")
+            conn.execute("DROP TABLE IF EXISTS temp.import_tags")
+
+    elapsed = time.perf_counter() - t0
+    total = n_videos + n_tags
+    print(f"Done in {elapsed:.2f}s ({total / max(elapsed, 1e-9):,.0f} rows/s)")
 
 
 def main():
@@ -229,9 +646,20 @@ def main():
 
     g = sub.add_parser("get", help="動画1件を表示")
     g.add_argument("id")
+    g.add_argument("--compact", action="store_true", help="JSON を1行で出す")
     g.set_defaults(func=cmd_get)
 
-    l = sub.add_parser("list", help="一覧表示")
+    l = sub.add_parser("list", help="一覧表示 (API の GET /videos と同じ検索/タグ条件・並び順)")
+    l.add_argument("--query", default="", help="タイトル/メモ/タグの全文検索")
+    l.add_argument("--tag", action="append", default=[], help="すべて持つ (AND)。複数指定可")
+    l.add_argument("--any-tag", action="append", default=[], help="どれかを持つ (OR)。複数指定可")
+    l.add_argument("--not-tag", action="append", default=[], help="持たない (NOT)。複数指定可")
+    l.add_argument("--order", default="-created", help="-created / -rating / title / relevance")
+    l.add_argument("--limit", type=int, default=None)
+    l.add_argument("--offset", type=int, default=0)
+    l.add_argument("--format", choices=LIST_FORMATS, default="text", help="tsv / ndjson はパイプで他のツールに渡す用")
+    l.add_argument("--fields", default="", help="tsv / ndjson で出す列 (例: id,title,rating)")
+    l.add_argument("--no-header", action="store_true", help="tsv の見出し行を出さない")
     l.set_defaults(func=cmd_list)
 
     # URL から登録
@@ -241,11 +669,30 @@ def main():
     au.add_argument("--tags", type=str, default=None, help="カンマ区切り: 例 'music,80s'")
     au.set_defaults(func=cmd_add_url)
 
+    iu = sub.add_parser("import-urls", help="URL の一覧 (ファイル or -) を videoId にそろえて一括登録")
+    iu.add_argument("file", help="1行1件 (空白区切りも可)。- なら標準入力")
+    iu.add_argument("--no-fetch", action="store_true", help="メタ取得ジョブを積まない")
+    iu.add_argument("--dry-run", action="store_true", help="解析して件数だけ表示")
+    iu.set_defaults(func=cmd_import_urls)
+
+    dd = sub.add_parser("dedupe", help="URL 形式などで重複登録された動画を videoId にまとめる")
+    dd.add_argument("--dry-run", action="store_true", help="書き込まずに件数だけ表示")
+    dd.add_argument("-v", "--verbose", action="store_true", help="1件ずつ表示")
+    dd.set_defaults(func=cmd_dedupe)
+
     # メタだけ更新
     fm = sub.add_parser("fetch-meta", help="既存IDのメタ情報をYoutubeから更新")
     fm.add_argument("id")
     fm.set_defaults(func=cmd_fetch_meta)
 
+    # メタを一括更新
+    rm = sub.add_parser("refresh-meta", help="登録済み動画のメタ情報を一括でYoutubeから更新")
+    rm.add_argument("ids", nargs="*", help="対象ID (省略時は全件)")
+    rm.add_argument("--missing-only", action="store_true", help="タイトル/サムネ未取得のものだけ")
+    rm.add_argument("--workers", type=int, default=4, help="並列に投げるバッチ数")
+    rm.add_argument("--use-cache", action="store_true", help="有効期限内のキャッシュがあれば問い合わせない")
+    rm.set_defaults(func=cmd_refresh_meta)
+
     # ★
     r = sub.add_parser("rate", help="★を設定")
     r.add_argument("id")
@@ -263,12 +710,58 @@ def main():
     tr.add_argument("tag")
     tr.set_defaults(func=cmd_tag_rm)
 
-    ex = sub.add_parser("export-csv", help="CSVインポート")
+    wk = sub.add_parser("worker", help="メタ情報取得ジョブのワーカーを動かす")
+    wk.add_argument("--once", action="store_true", help="実行可能なジョブが無くなったら終了")
+    wk.add_argument("--rate", type=float, default=2.0, help="YouTube への毎秒リクエスト数")
+    wk.add_argument("--burst", type=int, default=5)
+    wk.add_argument("--enqueue-missing", action="store_true", help="タイトル/サムネ未取得の動画をジョブに積む")
+    wk.set_defaults(func=cmd_worker)
+
+    tp = sub.add_parser("thumbs-prefetch", help="サムネイルをローカルに一括取得 (WebP の縮小版も作る)")
+    tp.add_argument("ids", nargs="*", help="対象ID (省略時は未取得の全件)")
+    tp.add_argument("--workers", type=int, default=4, help="並列ダウンロード数")
+    tp.add_argument("--no-variants", action="store_true", help="原本の保存だけにする (縮小版を作るには Pillow が必要)")
+    tp.set_defaults(func=cmd_thumbs_prefetch)
+
+    cp = sub.add_parser("changes-prune", help="変更ログ (GET /changes) の古いトゥームストーンを消す")
+    cp.add_argument("--days", type=float, default=30, help="これより古いものを消す")
+    cp.set_defaults(func=cmd_changes_prune)
+
+    sr = sub.add_parser("similar-refresh", help="似た動画 (GET /videos/{id}/similar) の索引を更新")
+    sr.add_argument("--full", action="store_true", help="変更の有無にかかわらず全件を計算し直す (タグの IDF も数え直す)")
+    sr.set_defaults(func=cmd_similar_refresh)
+
+    fr = sub.add_parser("fts-rebuild", help="全文検索インデックスを作り直す")
+    fr.set_defaults(func=cmd_fts_rebuild)
+
+    st = sub.add_parser("stats", help="ライブラリの統計 (件数・★の分布・タグ上位・日ごとの追加数)")
+    st.add_argument("--tags", type=int, default=20, help="表示するタグの上位件数")
+    st.add_argument("--days", type=int, default=14, help="日ごとの追加数をさかのぼる日数")
+    st.add_argument("--json", action="store_true", help="GET /stats と同じ形の JSON で出力")
+    st.set_defaults(func=cmd_stats)
+
+    sb = sub.add_parser("stats-rebuild", help="統計とタグ件数を videos / タグから数え直す")
+    sb.set_defaults(func=cmd_stats_rebuild)
+
+    sv = sub.add_parser("serve", help="API サーバーを起動 (--workers で複数プロセス)")
+    sv.add_argument("--host", default="127.0.0.1")
+    sv.add_argument("--port", type=int, default=8080)
+    sv.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")),
+                    help="ワーカープロセス数 (読み取りはコア数に応じて伸びる)")
+    sv.set_defaults(func=cmd_serve)
+
+    ex = sub.add_parser("export", aliases=["export-csv"], help="エクスポート (CSV / NDJSON / Parquet)")
     ex.add_argument("--dir", default="backup")
+    ex.add_argument("--format", choices=FORMATS, default="csv", help="parquet には pyarrow が必要")
+    ex.add_argument("--compress", choices=COMPRESSIONS, default="none",
+                    help="csv / ndjson の圧縮方式 (zstd には zstandard が必要)")
+    ex.add_argument("--since", default=None, help="この日時以降に更新された分だけ (例: '2025-01-01 00:00:00')")
     ex.set_defaults(func=cmd_export_csv)
 
     im = sub.add_parser("import-csv", help="CSVインポート")
     im.add_argument("--dir", default="backup")
+    im.add_argument("--chunk-size", type=int, default=5000, help="executemany 1回あたりの行数")
+    im.add_argument("--dry-run", action="store_true", help="書き込まずに差分の件数だけ表示")
     im.set_defaults(func=cmd_import_csv)
 
     args = p.parse_args()
@@ -1,33 +1,573 @@
+import atexit
+import itertools
 import os
+import queue
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from .metrics import observe_sql
+from .migrations import migrate
 
 DB_PATH = os.getenv("DATABASE_URL", "sqlite:///./app.db").replace("sqlite:///", "")
 
+# コネクションプールと PRAGMA の設定
+# 読み取り専用の接続数と、書き込み用の接続数 (どちらもプロセスごと)。
+# SQLite の書き込みはファイル全体で1本ずつなので、書き込み用は既定で1本にしてプロセス内で順番待ちさせる
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+WRITE_POOL_SIZE = int(os.getenv("DB_WRITE_POOL_SIZE", "1"))
+# 1 なら読み取り用の接続を immutable で開く (どのプロセスも書き込まないスナップショットを配信するときだけ)
+READ_IMMUTABLE = os.getenv("DB_READ_IMMUTABLE", "0") == "1"
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))
 
-def get_conn():
-    conn = sqlite3.connect(DB_PATH)
+
+class TimedConnection(sqlite3.Connection):
+    """
+    execute 系の所要時間を metrics に記録する接続
+    (カーソルを後から回す分の時間は含まない。遅いクエリの大半は最初の step で分かる)
+    """
+
+    def execute(self, sql, *args):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            observe_sql(sql, time.perf_counter() - t0)
+
+    def executemany(self, sql, *args):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            observe_sql(sql, time.perf_counter() - t0)
+
+    def executescript(self, sql):
+        t0 = time.perf_counter()
+        try:
+            return super().executescript(sql)
+        finally:
+            observe_sql(sql, time.perf_counter() - t0, op="SCRIPT")
+
+
+def _connect():
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                           factory=TimedConnection)
     conn.row_factory = sqlite3.Row
+    # 暗黙のトランザクションを BEGIN IMMEDIATE で始める。読んだ後に書き込みへ昇格しようとして
+    # 他プロセスの書き込みと衝突する (busy_timeout を待たずに SQLITE_BUSY になる) のを避ける
+    conn.isolation_level = "IMMEDIATE"
     # 参照整合のために外部キーを有効に
     conn.execute("PRAGMA foreign_keys = ON;")
+    # 読み書きを並行させるため WAL にする (DBファイルに永続化される)
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute("PRAGMA synchronous = NORMAL;")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS};")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE};")
+    # 負の値は KiB 単位
+    conn.execute(f"PRAGMA cache_size = {-CACHE_SIZE_KB};")
     return conn
 
 
+def _connect_readonly():
+    # WAL なので読み取りは書き込みをブロックしない (journal_mode はDBファイル側の設定なのでここでは触らない)
+    if READ_IMMUTABLE:
+        uri = Path(DB_PATH).resolve().as_uri() + "?immutable=1"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, factory=TimedConnection)
+    else:
+        conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                               factory=TimedConnection)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA query_only = ON;")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS};")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE};")
+    # 負の値は KiB 単位
+    conn.execute(f"PRAGMA cache_size = {-CACHE_SIZE_KB};")
+    return conn
+
+
+class ConnectionPool:
+    """長寿命の sqlite3 接続を使い回すスレッドセーフなプール"""
+
+    def __init__(self, factory, maxsize: int, timeout: float):
+        self._factory = factory
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+            with self._lock:
+                self.hits += 1
+            return conn
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created < self.maxsize
+            if can_create:
+                self._created += 1
+                self.misses += 1
+        if can_create:
+            try:
+                return self._factory()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        # 上限に達しているので返却待ち
+        t0 = time.monotonic()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f"connection pool exhausted (size={self.maxsize}, waited {self.timeout}s)") from None
+        with self._lock:
+            self.waits += 1
+            self.wait_seconds += time.monotonic() - t0
+        return conn
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            self._discard(conn)
+        else:
+            self._idle.put(conn)
+
+    def _discard(self, conn):
+        conn.close()
+        with self._lock:
+            self._created -= 1
+
+    def close(self):
+        """待機中の接続をすべて閉じる (貸出中のものは返却時に閉じる)"""
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": self._created,
+                "max_size": self.maxsize,
+                "idle": self._idle.qsize(),
+                "in_use": self._created - self._idle.qsize(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 6),
+            }
+
+
+_pool = ConnectionPool(_connect, WRITE_POOL_SIZE, POOL_TIMEOUT)
+_read_pool = ConnectionPool(_connect_readonly, POOL_SIZE, POOL_TIMEOUT)
+
+
+@contextmanager
+def get_conn():
+    """
+    書き込み用の接続をプールから借りる。with ブロックを抜けるとコミット (例外時はロールバック) して返却
+    使い方: with get_conn() as conn: ...
+    """
+    conn = _pool.acquire()
+    try:
+        with conn:
+            yield conn
+    finally:
+        _pool.release(conn)
+
+
+@contextmanager
+def get_read_conn():
+    """
+    読み取り専用 (query_only) の接続を借りる。書き込み用の接続の空きを待たないので、読むだけの処理はこちらを使う
+    使い方: with get_read_conn() as conn: ...
+    """
+    conn = _read_pool.acquire()
+    try:
+        yield conn
+    finally:
+        _read_pool.release(conn)
+
+
+# async エンドポイントからのDB処理を流す専用スレッド (プールサイズで上限を揃える)
+# CLI の起動を軽くするため、asyncio / concurrent.futures は初めて使うときに読み込む
+_db_executor = None
+_db_executor_lock = threading.Lock()
+
+
+def _get_db_executor():
+    global _db_executor
+    if _db_executor is None:
+        from concurrent.futures import ThreadPoolExecutor
+        with _db_executor_lock:
+            if _db_executor is None:
+                _db_executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="favtube-db")
+    return _db_executor
+
+
+async def run_db(fn, *args, **kwargs):
+    """同期のDB処理を専用スレッドで実行して await できるようにする"""
+    import asyncio
+    import functools
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_db_executor(), functools.partial(fn, *args, **kwargs))
+
+
+def iter_chunks(iterable, size: int):
+    """iterable を size 件ずつのリストにして返す (カーソルなら fetchmany の代わり、IN (...) の分割にも)"""
+    it = iter(iterable)
+    while chunk := list(itertools.islice(it, size)):
+        yield chunk
+
+
+def pool_stats() -> dict:
+    return {"write": _pool.stats(), "read": _read_pool.stats()}
+
+
+def close_pool():
+    _pool.close()
+    _read_pool.close()
+
+
+atexit.register(close_pool)
+
+
+_VERSION_TRIGGERS = "".join(f"""
+CREATE TRIGGER IF NOT EXISTS {table}_version_{ev[0].lower()} AFTER {ev} ON {table} BEGIN
+    UPDATE library_state SET version = version + 1 WHERE id = 1;
+END;
+""" for table in ("videos", "video_tag_links") for ev in ("INSERT", "UPDATE", "DELETE"))
+
+
 def init_db():
+    """
+    スキーマを最新の版まで上げ (migrations.py)、トリガーと派生テーブルを用意する
+    """
     with get_conn() as conn:
-        conn.executescript("""
-        CREATE TABLE IF NOT EXISTS videos (
-            id TEXT PRIMARY KEY,
-            title TEXT,
-            thumbnail_url TEXT,
-            rating INTEGER,
-            note TEXT,
-            created_at TEXT DEFAULT (datetime('now')),
-            updated_at TEXT DEFAULT (datetime('now'))
-        );
-        CREATE TABLE IF NOT EXISTS video_tags (
-            video_id TEXT,
-            tag TEXT,
-            PRIMARY KEY (video_id, tag),
-            FOREIGN KEY (video_id) REFERENCES videos(id) ON DELETE CASCADE
-        );
-        """)
+        migrate(conn)
+        conn.executescript(_VERSION_TRIGGERS)
+        _init_fts(conn)
+        _init_tag_counts(conn)
+        _init_changes(conn)
+        _init_similar(conn)
+        _init_stats(conn)
+
+
+# タイトル・メモ・タグの全文検索インデックス。rowid は videos.pk に揃える
+_TAGS_OF = "SELECT group_concat(t.name, ' ') FROM video_tag_links l JOIN tags t ON t.id = l.tag_id WHERE l.video_pk = {}"
+_FTS_TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS videos_fts_ai AFTER INSERT ON videos BEGIN
+    INSERT INTO videos_fts(rowid, title, note, tags)
+    VALUES (new.pk, new.title, new.note, ({_TAGS_OF.format("new.pk")}));
+END;
+CREATE TRIGGER IF NOT EXISTS videos_fts_au AFTER UPDATE OF title, note ON videos BEGIN
+    UPDATE videos_fts SET title = new.title, note = new.note WHERE rowid = new.pk;
+END;
+CREATE TRIGGER IF NOT EXISTS videos_fts_ad AFTER DELETE ON videos BEGIN
+    DELETE FROM videos_fts WHERE rowid = old.pk;
+END;
+CREATE TRIGGER IF NOT EXISTS video_tag_links_fts_ai AFTER INSERT ON video_tag_links BEGIN
+    UPDATE videos_fts SET tags = ({_TAGS_OF.format("new.video_pk")}) WHERE rowid = new.video_pk;
+END;
+CREATE TRIGGER IF NOT EXISTS video_tag_links_fts_ad AFTER DELETE ON video_tag_links BEGIN
+    UPDATE videos_fts SET tags = ({_TAGS_OF.format("old.video_pk")}) WHERE rowid = old.video_pk;
+END;
+"""
+
+
+def _init_fts(conn):
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='videos_fts'").fetchone()
+    if not exists:
+        try:
+            # 日本語でも部分一致できるよう trigram を使う (SQLite 3.34+)
+            conn.execute("CREATE VIRTUAL TABLE videos_fts USING fts5(title, note, tags, tokenize='trigram')")
+        except sqlite3.OperationalError:
+            conn.execute("CREATE VIRTUAL TABLE videos_fts USING fts5(title, note, tags)")
+    conn.executescript(_FTS_TRIGGERS)
+    if not exists:
+        rebuild_fts(conn)
+
+
+def rebuild_fts(conn) -> int:
+    """全文検索インデックスを videos / タグから作り直す"""
+    conn.execute("DELETE FROM videos_fts")
+    cur = conn.execute(f"""
+    INSERT INTO videos_fts(rowid, title, note, tags)
+    SELECT v.pk, v.title, v.note, ({_TAGS_OF.format("v.pk")})
+    FROM videos v
+    """)
+    conn.execute("INSERT INTO videos_fts(videos_fts) VALUES('optimize')")
+    return cur.rowcount
+
+
+def save_video_metas(conn, metas):
+    """YouTube から取得したメタ情報 (dict の iterable) をまとめて upsert し、変更件数を返す"""
+    cur = conn.executemany("""
+    INSERT INTO videos(id, title, thumbnail_url)
+    VALUES(:id, :title, :thumbnail_url)
+    ON CONFLICT(id) DO UPDATE SET
+        title=COALESCE(excluded.title, videos.title),
+        thumbnail_url=COALESCE(excluded.thumbnail_url, videos.thumbnail_url),
+        updated_at=datetime('now')
+    WHERE videos.title IS NOT COALESCE(excluded.title, videos.title)
+       OR videos.thumbnail_url IS NOT COALESCE(excluded.thumbnail_url, videos.thumbnail_url)
+    """, list(metas))
+    return cur.rowcount
+
+
+# タグごとの件数。video_tag_links のトリガーで増減させ、使われなくなったタグは辞書からも消す
+_TAG_COUNT_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS video_tag_links_count_ai AFTER INSERT ON video_tag_links BEGIN
+    INSERT INTO tag_counts(tag, n) SELECT name, 1 FROM tags WHERE id = new.tag_id
+    ON CONFLICT(tag) DO UPDATE SET n = n + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS video_tag_links_count_ad AFTER DELETE ON video_tag_links BEGIN
+    UPDATE tag_counts SET n = n - 1 WHERE tag = (SELECT name FROM tags WHERE id = old.tag_id);
+    DELETE FROM tag_counts WHERE tag = (SELECT name FROM tags WHERE id = old.tag_id) AND n <= 0;
+    DELETE FROM tags WHERE id = old.tag_id
+      AND NOT EXISTS (SELECT 1 FROM video_tag_links WHERE tag_id = old.tag_id);
+END;
+"""
+
+
+def _init_tag_counts(conn):
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='tag_counts'").fetchone()
+    conn.executescript("""
+    CREATE TABLE IF NOT EXISTS tag_counts (
+        tag TEXT PRIMARY KEY,
+        n INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_tag_counts_nocase ON tag_counts(tag COLLATE NOCASE);
+    CREATE INDEX IF NOT EXISTS idx_tag_counts_n ON tag_counts(n, tag);
+    -- 件数の多い順 (同数はタグ名順) の上位 N 件を並べ替えなしで引くため
+    CREATE INDEX IF NOT EXISTS idx_tag_counts_top ON tag_counts(n DESC, tag);
+    """ + _TAG_COUNT_TRIGGERS)
+    if not exists:
+        rebuild_tag_counts(conn)
+
+
+def rebuild_tag_counts(conn) -> int:
+    """タグ件数を video_tag_links から数え直す"""
+    conn.execute("DELETE FROM tag_counts")
+    cur = conn.execute("""
+    INSERT INTO tag_counts(tag, n)
+    SELECT t.name, c.n FROM (SELECT tag_id, COUNT(*) AS n FROM video_tag_links GROUP BY tag_id) c
+    JOIN tags t ON t.id = c.tag_id
+    """)
+    return cur.rowcount
+
+
+# 差分同期用の変更ログ (GET /changes)。動画ごとに最新の1行だけを残し、
+# 変更のたびにその行を消して新しい seq で入れ直す (削除された動画の行はトゥームストーン)
+# (動画の削除に伴う連鎖削除では動画の行がもう無いので、タグ側のトリガーは何もしない)
+_CHANGE_TRIGGERS = "".join(f"""
+CREATE TRIGGER IF NOT EXISTS videos_changes_{ev[0].lower()} AFTER {ev} ON videos BEGIN
+    DELETE FROM changes WHERE video_id = {row}.id;
+    INSERT INTO changes(video_id) VALUES ({row}.id);
+END;
+""" for ev, row in (("INSERT", "new"), ("UPDATE", "new"), ("DELETE", "old"))) + "".join(f"""
+CREATE TRIGGER IF NOT EXISTS video_tag_links_changes_{ev[0].lower()} AFTER {ev} ON video_tag_links BEGIN
+    DELETE FROM changes WHERE video_id = (SELECT id FROM videos WHERE pk = {row}.video_pk);
+    INSERT INTO changes(video_id) SELECT id FROM videos WHERE pk = {row}.video_pk;
+END;
+""" for ev, row in (("INSERT", "new"), ("UPDATE", "new"), ("DELETE", "old")))
+
+
+def _init_changes(conn):
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='changes'").fetchone()
+    conn.executescript("""
+    CREATE TABLE IF NOT EXISTS changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        video_id TEXT NOT NULL UNIQUE,
+        changed_at TEXT DEFAULT (datetime('now'))
+    );
+    CREATE INDEX IF NOT EXISTS idx_changes_at ON changes(changed_at);
+    -- これより前の seq を持つクライアントは取りこぼしがあるので全件取り直させる
+    CREATE TABLE IF NOT EXISTS changes_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        horizon INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO changes_state(id, horizon) VALUES (1, 0);
+    """ + _CHANGE_TRIGGERS)
+    if not exists:
+        # 既存の動画を最初の変更として載せ、since=0 から全件を同期できるようにする
+        conn.execute("INSERT INTO changes(video_id) SELECT id FROM videos ORDER BY created_at, id")
+
+
+# 似た動画 (similar.py) の上位 K 件と、計算し直しが必要な動画の印。
+# 印は同じ動画でも付け直すたびに消して新しい seq で入れ、計算中に付いた分を消さないようにする
+# (INSERT OR REPLACE はトリガーの外側の UPSERT の衝突処理に上書きされるので使わない)
+_SIMILAR_TRIGGERS = "".join(f"""
+CREATE TRIGGER IF NOT EXISTS video_tag_links_similar_{ev[0].lower()} AFTER {ev} ON video_tag_links BEGIN
+    DELETE FROM similar_dirty WHERE video_pk = {row}.video_pk;
+    INSERT INTO similar_dirty(video_pk) VALUES ({row}.video_pk);
+END;
+""" for ev, row in (("INSERT", "new"), ("DELETE", "old"))) + """
+CREATE TRIGGER IF NOT EXISTS videos_similar_rating AFTER UPDATE OF rating ON videos
+WHEN old.rating IS NOT new.rating BEGIN
+    DELETE FROM similar_dirty WHERE video_pk = new.pk;
+    INSERT INTO similar_dirty(video_pk) VALUES (new.pk);
+END;
+CREATE TRIGGER IF NOT EXISTS videos_similar_d AFTER DELETE ON videos BEGIN
+    DELETE FROM similar_dirty WHERE video_pk IN (SELECT video_pk FROM video_similar WHERE neighbor_pk = old.pk);
+    INSERT INTO similar_dirty(video_pk) SELECT DISTINCT video_pk FROM video_similar WHERE neighbor_pk = old.pk;
+    DELETE FROM video_similar WHERE video_pk = old.pk OR neighbor_pk = old.pk;
+END;
+"""
+
+
+def _init_similar(conn):
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='video_similar'").fetchone()
+    conn.executescript("""
+    CREATE TABLE IF NOT EXISTS video_similar (
+        video_pk INTEGER NOT NULL,
+        rank INTEGER NOT NULL,
+        neighbor_pk INTEGER NOT NULL,
+        score REAL NOT NULL,
+        PRIMARY KEY (video_pk, rank)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_video_similar_neighbor ON video_similar(neighbor_pk);
+    CREATE TABLE IF NOT EXISTS similar_dirty (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        video_pk INTEGER NOT NULL UNIQUE
+    );
+    -- 最後の全件計算で IDF に使った数 (差分更新はこれを使い回す。tags.id は再利用されうるので名前で持つ)
+    CREATE TABLE IF NOT EXISTS similar_idf (
+        tag TEXT PRIMARY KEY,
+        df INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS similar_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        videos INTEGER NOT NULL
+    );
+    """ + _SIMILAR_TRIGGERS)
+    if not exists:
+        # タグ付きの動画をすべて未計算にしておく (最初の refresh は全件の計算になる)
+        conn.execute("INSERT OR IGNORE INTO similar_dirty(video_pk) SELECT DISTINCT video_pk FROM video_tag_links")
+
+
+# ライブラリの統計 (GET /stats)。件数・★の分布・日ごとの追加数をトリガーで増減させ、
+# 読むときは集計済みの行を引くだけにする (タグごとの件数は tag_counts をそのまま使う)
+# 先に 0 の行を入れてから足すのは、トリガー内の衝突処理が外側の文の ON CONFLICT に上書きされるため
+_STATS_INC = """
+    INSERT INTO {table}({col}, n) SELECT {key}, 0 WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {col} = {key});
+    UPDATE {table} SET n = n + 1 WHERE {col} = {key};
+"""
+_STATS_DEC = """
+    UPDATE {table} SET n = n - 1 WHERE {col} = {key};
+    DELETE FROM {table} WHERE {col} = {key} AND n <= 0;
+"""
+# ★なしは 0、作成日時が無い/読めない動画は日付 '' に数える
+_RATING_KEY = "IFNULL({}.rating, 0)"
+_DAY_KEY = "IFNULL(date({}.created_at), '')"
+
+
+def _stats_bump(template, row):
+    return (template.format(table="stats_ratings", col="rating", key=_RATING_KEY.format(row))
+            + template.format(table="stats_daily", col="day", key=_DAY_KEY.format(row)))
+
+
+_STATS_TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS videos_stats_i AFTER INSERT ON videos BEGIN
+    UPDATE stats_totals SET videos = videos + 1, rated = rated + (new.rating IS NOT NULL),
+        rating_sum = rating_sum + IFNULL(new.rating, 0) WHERE id = 1;
+{_stats_bump(_STATS_INC, "new")}
+END;
+CREATE TRIGGER IF NOT EXISTS videos_stats_d AFTER DELETE ON videos BEGIN
+    UPDATE stats_totals SET videos = videos - 1, rated = rated - (old.rating IS NOT NULL),
+        rating_sum = rating_sum - IFNULL(old.rating, 0) WHERE id = 1;
+{_stats_bump(_STATS_DEC, "old")}
+END;
+CREATE TRIGGER IF NOT EXISTS videos_stats_rating AFTER UPDATE OF rating ON videos
+WHEN old.rating IS NOT new.rating BEGIN
+    UPDATE stats_totals SET rated = rated - (old.rating IS NOT NULL) + (new.rating IS NOT NULL),
+        rating_sum = rating_sum - IFNULL(old.rating, 0) + IFNULL(new.rating, 0) WHERE id = 1;
+{_STATS_DEC.format(table="stats_ratings", col="rating", key=_RATING_KEY.format("old"))}
+{_STATS_INC.format(table="stats_ratings", col="rating", key=_RATING_KEY.format("new"))}
+END;
+CREATE TRIGGER IF NOT EXISTS videos_stats_created AFTER UPDATE OF created_at ON videos
+WHEN {_DAY_KEY.format("old")} IS NOT {_DAY_KEY.format("new")} BEGIN
+{_STATS_DEC.format(table="stats_daily", col="day", key=_DAY_KEY.format("old"))}
+{_STATS_INC.format(table="stats_daily", col="day", key=_DAY_KEY.format("new"))}
+END;
+CREATE TRIGGER IF NOT EXISTS video_tag_links_stats_i AFTER INSERT ON video_tag_links BEGIN
+    UPDATE stats_totals SET tag_links = tag_links + 1 WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS video_tag_links_stats_d AFTER DELETE ON video_tag_links BEGIN
+    UPDATE stats_totals SET tag_links = tag_links - 1 WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS tag_counts_stats_i AFTER INSERT ON tag_counts BEGIN
+    UPDATE stats_totals SET tags = tags + 1 WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS tag_counts_stats_d AFTER DELETE ON tag_counts BEGIN
+    UPDATE stats_totals SET tags = tags - 1 WHERE id = 1;
+END;
+"""
+
+
+def _init_stats(conn):
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='stats_totals'").fetchone()
+    conn.executescript("""
+    CREATE TABLE IF NOT EXISTS stats_totals (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        videos INTEGER NOT NULL DEFAULT 0,
+        rated INTEGER NOT NULL DEFAULT 0,
+        rating_sum INTEGER NOT NULL DEFAULT 0,
+        tag_links INTEGER NOT NULL DEFAULT 0,
+        tags INTEGER NOT NULL DEFAULT 0
+    );
+    INSERT OR IGNORE INTO stats_totals(id) VALUES (1);
+    CREATE TABLE IF NOT EXISTS stats_ratings (
+        rating INTEGER PRIMARY KEY,
+        n INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS stats_daily (
+        day TEXT PRIMARY KEY,
+        n INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    """ + _STATS_TRIGGERS)
+    if not exists:
+        rebuild_stats(conn)
+
+
+def rebuild_stats(conn) -> int:
+    """統計を videos / video_tag_links / tag_counts から数え直す (返却: 日ごとの行数)"""
+    conn.execute("""
+    UPDATE stats_totals SET
+        videos = (SELECT COUNT(*) FROM videos),
+        rated = (SELECT COUNT(rating) FROM videos),
+        rating_sum = (SELECT IFNULL(SUM(rating), 0) FROM videos),
+        tag_links = (SELECT COUNT(*) FROM video_tag_links),
+        tags = (SELECT COUNT(*) FROM tag_counts)
+    WHERE id = 1
+    """)
+    conn.execute("DELETE FROM stats_ratings")
+    conn.execute(f"""
+    INSERT INTO stats_ratings(rating, n) SELECT {_RATING_KEY.format("v")}, COUNT(*) FROM videos v GROUP BY 1
+    """)
+    conn.execute("DELETE FROM stats_daily")
+    cur = conn.execute(f"""
+    INSERT INTO stats_daily(day, n) SELECT {_DAY_KEY.format("v")}, COUNT(*) FROM videos v GROUP BY 1
+    """)
+    return cur.rowcount
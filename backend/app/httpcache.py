@@ -0,0 +1,113 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+
+
+def library_version(conn) -> int:
+    """videos / video_tags が変わるたびにトリガーで増える世代番号"""
+    return conn.execute("SELECT version FROM library_state WHERE id = 1").fetchone()[0]
+
+
+def make_etag(version: int, suffix: str = "") -> str:
+    """suffix: 世代番号以外で内容が変わる要素 (日付など)"""
+    return f'W/"v{version}{suffix}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    inm = request.headers.get("if-none-match")
+    if not inm:
+        return False
+    if inm.strip() == "*":
+        return True
+    # 弱い比較なので W/ は無視して比べる
+    want = etag.removeprefix("W/")
+    return any(t.strip().removeprefix("W/") == want for t in inm.split(","))
+
+
+def http_date(sqlite_ts: str | None) -> str | None:
+    """
+    SQLite の datetime('now') (UTC) を HTTP-date にする
+    インポートされた ISO 8601 (T 区切り/タイムゾーン付き) も受け付け、読めない値は None (Last-Modified を付けない)
+    """
+    if not sqlite_ts:
+        return None
+    try:
+        dt = datetime.fromisoformat(sqlite_ts)
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return formatdate(dt.timestamp(), usegmt=True)
+
+
+def modified_since(request: Request, last_modified: str | None) -> bool:
+    """If-Modified-Since より新しければ True (ヘッダが無い/壊れている場合も True)"""
+    ims = request.headers.get("if-modified-since")
+    if not ims or not last_modified:
+        return True
+    try:
+        return parsedate_to_datetime(last_modified) > parsedate_to_datetime(ims)
+    except (TypeError, ValueError):
+        return True
+
+
+def not_modified(etag: str, last_modified: str | None = None) -> Response:
+    headers = {"ETag": etag}
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    return Response(status_code=304, headers=headers)
+
+
+def json_response(body: bytes, etag: str, last_modified: str | None = None) -> Response:
+    # no-cache: 保存はしてよいが使う前に必ず ETag で再検証させる
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+class ResponseCache:
+    """
+    シリアライズ済みレスポンスのLRU。エントリは世代番号つきで、
+    世代が変わっていれば (CLI など別プロセスからの書き込みでも) ヒットしない
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version: int) -> bytes | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version: int, body: bytes):
+        with self._lock:
+            self._data[key] = (version, body)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def get_or_build(self, key, version: int, build) -> bytes:
+        body = self.get(key, version)
+        if body is None:
+            body = orjson.dumps(build())
+            self.put(key, version, body)
+        return body
@@ -1,13 +1,84 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from .youtube import parse_video_id_from_url, fetch_video_meta, fetch_youtube_title
-from typing import List, Optional
+from fastapi.responses import FileResponse, ORJSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+from .youtube import (
+    YOUTUBE_API_KEY,
+    cached_video_meta,
+    fetch_video_meta_batch_async,
+    aclose_async_client,
+)
+from typing import List, Literal, Optional
+from contextlib import asynccontextmanager
 import os
-
-from .db import get_conn, init_db
-
-app = FastAPI(title="FavTube")
+import sqlite3
+import threading
+import time
+
+import orjson
+
+from .videoid import canonical_video_id, resolve_ids
+from .search import VIDEO_FIELDS, build_list_query, parse_fields
+from .httpcache import (
+    ResponseCache,
+    etag_matches,
+    http_date,
+    json_response,
+    library_version,
+    make_etag,
+    modified_since,
+    not_modified,
+)
+from .db import get_conn, get_read_conn, init_db, save_video_metas, pool_stats, close_pool, run_db
+from .worker import enqueue_meta, pending_jobs, run_worker
+from .thumbs import MAX_AGE as THUMBS_MAX_AGE, thumbnail_file
+from .changes import MAX_LIMIT as CHANGES_MAX_LIMIT, read_changes, wait_for_changes
+from .similar import REFRESH_INTERVAL as SIMILAR_REFRESH_INTERVAL, TOP_K as SIMILAR_TOP_K
+from .similar import read_similar, run_similar_refresher, similar_available
+from .stats import DAYS as STATS_DAYS, MAX_DAYS as STATS_MAX_DAYS, MAX_TOP_TAGS as STATS_MAX_TOP_TAGS
+from .stats import TOP_TAGS as STATS_TOP_TAGS, read_stats, utc_today
+from . import metrics
+
+# メタ取得ワーカーをAPIプロセス内でも動かすか (別途 `favtube worker` を動かすなら 0 に)
+INPROCESS_WORKER = os.getenv("FAVTUBE_INPROCESS_WORKER", "1") != "0"
+# このプロセスでバックグラウンドのスレッドを動かすか (`favtube serve --workers N` では親プロセスだけが動かす)
+BACKGROUND_TASKS = os.getenv("FAVTUBE_BACKGROUND_TASKS", "1") != "0"
+
+
+# 似た動画の索引を計算できるか (requirements-optional.txt の numpy / scipy)
+_SIMILAR_AVAILABLE = similar_available()
+
+
+def start_background(stop: threading.Event) -> list[threading.Thread]:
+    """メタ取得ワーカーと似た動画の差分更新をデーモンスレッドで起動する"""
+    threads = []
+    if INPROCESS_WORKER and YOUTUBE_API_KEY:
+        threads.append(threading.Thread(target=run_worker, kwargs={"stop": stop, "log": None},
+                                        name="favtube-meta-worker", daemon=True))
+    # 似た動画の上位K件をタグ/★の変更に合わせて差分更新する (numpy / scipy が無ければ動かさない)
+    if SIMILAR_REFRESH_INTERVAL > 0 and _SIMILAR_AVAILABLE:
+        threads.append(threading.Thread(target=run_similar_refresher,
+                                        kwargs={"stop": stop, "interval": SIMILAR_REFRESH_INTERVAL, "log": None},
+                                        name="favtube-similar", daemon=True))
+    for t in threads:
+        t.start()
+    return threads
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    stop = threading.Event()
+    threads = start_background(stop) if BACKGROUND_TASKS else []
+    yield
+    stop.set()
+    for t in threads:
+        t.join(timeout=5)
+    # 終了時に YouTube クライアントとプールの接続を確実に閉じる
+    await aclose_async_client()
+    close_pool()
+
+
+app = FastAPI(title="FavTube", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,7 +89,48 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-init_db()
+
+@app.middleware("http")
+async def _record_latency(request: Request, call_next):
+    # ラベルはパスそのものではなくルートのテンプレート (/videos/{id}) にして系列数を抑える
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.http_request_duration.observe(
+            time.perf_counter() - t0, request.method, getattr(route, "path", "unmatched"), str(status))
+
+
+# `favtube serve` は起動前に親プロセスで済ませているので、各ワーカープロセスでは繰り返さない
+if os.getenv("FAVTUBE_INIT_DB", "1") != "0":
+    init_db()
+
+# 一覧と /tags/all, /stats のシリアライズ済みレスポンス (書き込み系エンドポイントで消す)
+_response_cache = ResponseCache(maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "256")))
+
+
+def _invalidate():
+    _response_cache.clear()
+
+
+@metrics.register_collector
+def _gauges():
+    pools = pool_stats()
+    return [
+        ("favtube_db_pool_connections", "SQLite connections in the pool by state.", "gauge",
+         [({"pool": name, "state": state}, p[state]) for name, p in pools.items() for state in ("idle", "in_use")]),
+        ("favtube_db_pool_waits_total", "Times a request waited for a free connection.", "counter",
+         [({"pool": name}, p["waits"]) for name, p in pools.items()]),
+        ("favtube_db_pool_wait_seconds_total", "Total time spent waiting for a connection.", "counter",
+         [({"pool": name}, p["wait_seconds"]) for name, p in pools.items()]),
+        ("favtube_response_cache_requests_total", "Serialized response cache lookups.", "counter",
+         [({"result": "hit"}, _response_cache.hits), ({"result": "miss"}, _response_cache.misses)]),
+        ("favtube_meta_jobs_pending", "Queued YouTube metadata jobs.", "gauge", [({}, pending_jobs())]),
+    ]
 
 
 class VideoUpsert(BaseModel):
@@ -45,12 +157,45 @@ class AddUrlIn(BaseModel):
     tags: list[str] | None = None
 
 
+class RefreshMetaIn(BaseModel):
+    ids: list[str] | None = None
+    missing_only: bool = False
+
+
+class BatchOp(BaseModel):
+    op: Literal["upsert", "rate", "tag_add", "tag_remove", "note"]
+    id: str
+    title: str | None = None
+    thumbnail_url: str | None = None
+    rating: int | None = None
+    tags: list[str] | None = None
+    tag: str | None = None
+    note: str | None = None
+
+
+class BatchIn(BaseModel):
+    ops: list[BatchOp] = Field(..., max_length=1000)
+
+
+class ResolveIn(BaseModel):
+    urls: list[str] = Field(..., max_length=10000)
+
+
+def _cached_meta(video_id: str) -> dict:
+    """キャッシュにあるメタ情報だけを返す (YouTube には問い合わせない)"""
+    cached = cached_video_meta(video_id)
+    return (cached[0] if cached else None) or {}
+
+
 @app.post("/videos/add-url")
 def add_by_url(body: AddUrlIn):
-    vid = parse_video_id_from_url(body.url)
+    vid = canonical_video_id(body.url)
     if not vid:
         raise HTTPException(400, "invalid url")
-    meta = fetch_video_meta(vid)
+    cached = cached_video_meta(vid)
+    if cached and cached[1] and cached[0] is None:
+        raise HTTPException(404, "Video not found or not accessible.")
+    meta = (cached[0] if cached else None) or {}
     with get_conn() as conn:
         conn.execute("""
         INSERT INTO videos(id, title, thumbnail_url)
@@ -59,57 +204,159 @@ def add_by_url(body: AddUrlIn):
         title=COALESCE(excluded.title, videos.title),
         thumbnail_url=COALESCE(excluded.thumbnail_url, videos.thumbnail_url),
         updated_at=datetime('now')
-        """, (meta["id"], meta["title"], meta["thumbnail_url"]))
+        """, (vid, meta.get("title"), meta.get("thumbnail_url")))
         if body.rate:
             conn.execute(
                 "UPDATE videos SET rating=?, updated_at=datetime('now') WHERE id=?", (body.rate, vid))
         if body.tags:
             for t in set(body.tags):
                 conn.execute("INSERT OR IGNORE INTO video_tags(video_id, tag) VALUES(?,?)", (vid, t))
-    return {"ok": True, "id": vid, "title": meta["title"]}
+        title = conn.execute("SELECT title FROM videos WHERE id=?", (vid,)).fetchone()["title"]
+        # メタ情報はワーカーが後から埋める (キャッシュが古い場合も取り直す)
+        pending = title is None or not (cached and cached[1])
+        if pending:
+            enqueue_meta(conn, [vid])
+    _invalidate()
+    return {"ok": True, "id": vid, "title": title, "pending": pending}
+
+
+@app.post("/resolve")
+def resolve(body: ResolveIn):
+    """URL の一覧を videoId に正規化し、登録済みかどうかを添えて返す (ids は重複を除いた出現順)"""
+    ids, unique = resolve_ids(body.urls)
+    registered = set()
+    with get_read_conn() as conn:
+        # SQLite の変数上限を超えないよう分割して引く
+        for i in range(0, len(unique), 500):
+            chunk = unique[i:i + 500]
+            registered.update(r["id"] for r in conn.execute(
+                f"SELECT id FROM videos WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+    return {
+        "results": [{"url": u, "id": v, "registered": v in registered} for u, v in zip(body.urls, ids)],
+        "ids": unique,
+        "invalid": ids.count(None),
+    }
+
+
+def _select_ids(missing_only: bool) -> list[str]:
+    sql = "SELECT id FROM videos"
+    if missing_only:
+        sql += " WHERE title IS NULL OR thumbnail_url IS NULL"
+    with get_read_conn() as conn:
+        return [r["id"] for r in conn.execute(sql)]
+
+
+def _save_metas(metas) -> int:
+    with get_conn() as conn:
+        return save_video_metas(conn, metas)
+
+
+@app.post("/videos/refresh-meta")
+async def refresh_meta(body: RefreshMetaIn):
+    ids = body.ids or await run_db(_select_ids, body.missing_only)
+    try:
+        metas = await fetch_video_meta_batch_async(ids, refresh=True)
+    except RuntimeError as e:
+        raise HTTPException(502, str(e))
+    changed = await run_db(_save_metas, list(metas.values()))
+    _invalidate()
+    return {
+        "ok": True,
+        "requested": len(ids),
+        "fetched": len(metas),
+        "changed": changed,
+        "not_found": sorted(set(ids) - metas.keys()),
+    }
 
 
 @app.get("/healthz")
 def healthz():
-    return {"status": "ok"}
+    return {"status": "ok", "db_pool": pool_stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 @app.get("/videos")
-def list_videos(query: str = "", tag: str = "", order: str = "-created"):
-    sql = "SELECT * FROM videos"
-    params = []
-    where = []
-    if query:
-        where.append("title LIKE ?")
-        params.append(f"%{query}%")
-    if tag:
-        sql = "SELECT v.* FROM videos v JOIN video_tags t ON v.id=t.video_id"
-        where.append("t.tag = ?")
-        params.append(tag)
-    if where:
-        sql += " WHERE " + " AND ".join(where)
-    if order == "-created":
-        sql += " ORDER BY created_at DESC"
-    elif order == "title":
-        sql += " ORDER BY title ASC"
-    elif order == "-rating":
-        sql += " ORDER BY rating DESC"
-    with get_conn() as conn:
+def list_videos(request: Request, query: str = "",
+                tag: list[str] = Query([]), any_tag: list[str] = Query([]), not_tag: list[str] = Query([]),
+                order: str = "-created",
+                limit: int = Query(50, ge=1, le=500), cursor: str | None = None, fields: str = ""):
+    # tag はすべて持つ (AND)、any_tag はどれか (OR)、not_tag は除外 (NOT)。いずれも複数指定可
+    try:
+        cols = parse_fields(fields)
+        sql, params, next_cursor = build_list_query(
+            query=query, tags_all=tag, tags_any=any_tag, tags_not=not_tag,
+            order=order, fields=cols, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    def build():
         rows = conn.execute(sql, params).fetchall()
-    return [dict(r) for r in rows]
+        return {
+            "items": [{c: r[c] for c in cols} for r in rows],
+            "next_cursor": next_cursor(rows),
+        }
+
+    key = ("videos", query, tuple(tag), tuple(any_tag), tuple(not_tag), order, limit, cursor, tuple(cols))
+    with get_read_conn() as conn:
+        version = library_version(conn)
+        etag = make_etag(version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        body = _response_cache.get_or_build(key, version, build)
+    return json_response(body, etag)
 
 
 @app.get("/videos/{id}")
-def get_video(id: str):
-    with get_conn() as conn:
-        v = conn.execute("SELECT * FROM videos WHERE id=?", (id,)).fetchone()
+def get_video(request: Request, id: str):
+    with get_read_conn() as conn:
+        etag = make_etag(library_version(conn))
+        v = conn.execute(f"SELECT {', '.join(VIDEO_FIELDS)} FROM videos WHERE id=?", (id,)).fetchone()
         if not v:
             raise HTTPException(404, "not found")
+        last_modified = http_date(v["updated_at"])
+        if etag_matches(request, etag) or (
+                "if-none-match" not in request.headers and not modified_since(request, last_modified)):
+            return not_modified(etag, last_modified)
         tags = [r["tag"] for r in conn.execute(
             "SELECT tag FROM video_tags WHERE video_id=?", (id,)).fetchall()]
     d = dict(v)
     d["tags"] = tags
-    return d
+    return json_response(orjson.dumps(d), etag, last_modified)
+
+
+@app.get("/videos/{id}/similar")
+def get_similar(id: str, limit: int = Query(10, ge=1, le=SIMILAR_TOP_K)):
+    # 事前計算した video_similar を主キーで引くだけ (タグの結合や類似度の計算はしない)
+    with get_read_conn() as conn:
+        items = read_similar(conn, id, limit)
+        if items is None:
+            raise HTTPException(404, "not found")
+        # 変更が similar_refresher にまだ反映されていなければ true
+        stale = conn.execute(
+            "SELECT 1 FROM similar_dirty WHERE video_pk = (SELECT pk FROM videos WHERE id=?)", (id,)).fetchone()
+    # available: numpy / scipy が入っていて索引が更新されるか (false なら items は空のまま増えない)
+    return {"items": items, "stale": stale is not None, "available": _SIMILAR_AVAILABLE}
+
+
+@app.get("/thumbs/{id}")
+def get_thumb(request: Request, id: str, w: int = Query(320, ge=1, le=4096)):
+    """ローカルに縮小済みのサムネイル (初回だけ YouTube の CDN から取得する)"""
+    try:
+        found = thumbnail_file(id, w)
+    except RuntimeError as e:
+        raise HTTPException(502, str(e))
+    if found is None:
+        raise HTTPException(404, "thumbnail not found")
+    path, media_type, etag = found
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={THUMBS_MAX_AGE}"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    # FileResponse はファイルをそのまま流す (サーバーが対応していれば sendfile)
+    return FileResponse(path, media_type=media_type, headers=headers)
 
 
 @app.post("/videos")
@@ -123,6 +370,7 @@ def upsert_video(v: VideoUpsert):
           thumbnail_url=COALESCE(excluded.thumbnail_url, videos.thumbnail_url),
           updated_at=datetime('now')
         """, (v.id, v.title, v.thumbnail_url))
+    _invalidate()
     return {"ok": True}
 
 
@@ -131,25 +379,21 @@ def set_rating(id: str, body: RatingIn):
     if not (1 <= body.rating <= 5):
         raise HTTPException(400, "rating must be 1..5")
 
+    # ★タイトルはキャッシュにあれば使い、無ければワーカーに任せる
+    meta = _cached_meta(id)
     with get_conn() as conn:
-        cur = conn.execute("SELECT 1 FROM videos WHERE id=?", (id,)).fetchone()
-        if not cur:
-            conn.execute("INSERT INTO videos (id, title) VALUES (?, ?)", (id, None))
-
-        # ★タイトルをYouTubeから取得
-        title = fetch_youtube_title(id)
-        if title:
-            conn.execute(
-                "UPDATE videos SET title=?, rating=?, updated_at=datetime('now') WHERE id=?",
-                (title, body.rating, id),
-            )
-        else:
-            # タイトル取得できない場合は評価だけ更新
-            conn.execute(
-                "UPDATE videos SET rating=?, updated_at=datetime('now') WHERE id=?",
-                (body.rating, id),
-            )
-
+        conn.execute("""
+        INSERT INTO videos(id, title, thumbnail_url, rating) VALUES(?,?,?,?)
+        ON CONFLICT(id) DO UPDATE SET
+          title=COALESCE(videos.title, excluded.title),
+          thumbnail_url=COALESCE(videos.thumbnail_url, excluded.thumbnail_url),
+          rating=excluded.rating,
+          updated_at=datetime('now')
+        """, (id, meta.get("title"), meta.get("thumbnail_url"), body.rating))
+        title = conn.execute("SELECT title FROM videos WHERE id=?", (id,)).fetchone()["title"]
+        if title is None:
+            enqueue_meta(conn, [id])
+    _invalidate()
     return {"ok": True, "title": title}
 
 
@@ -159,6 +403,7 @@ def add_tags(id: str, body: TagsIn):
         for t in set(body.tags):
             conn.execute("INSERT OR IGNORE INTO video_tags(video_id, tag) VALUES(?,?)", (id, t))
         conn.execute("UPDATE videos SET updated_at=datetime('now') WHERE id=?", (id,))
+    _invalidate()
     return {"ok": True}
 
 
@@ -167,15 +412,96 @@ def remove_tag(id: str, tag: str):
     with get_conn() as conn:
         conn.execute("DELETE FROM video_tags WHERE video_id=? AND tag=?", (id, tag))
         conn.execute("UPDATE videos SET updated_at=datetime('now') WHERE id=?", (id,))
+    _invalidate()
     return {"ok": True}
 
 
+def _read_changes(since: int, limit: int) -> dict:
+    with get_read_conn() as conn:
+        return read_changes(conn, since, limit)
+
+
+@app.get("/changes")
+async def get_changes(since: int = Query(0, ge=0), limit: int = Query(500, ge=1, le=CHANGES_MAX_LIMIT),
+                      wait: float = Query(0, ge=0, le=60)):
+    """
+    since (前回の next) より後の変更だけを返す。reset=true なら GET /videos から取り直す
+    wait > 0 なら新しい変更が来るまで最大 wait 秒待つ (ロングポーリング)
+    """
+    result = await run_db(_read_changes, since, limit)
+    if wait and not result["changes"] and not result["reset"]:
+        if await wait_for_changes(since, wait):
+            result = await run_db(_read_changes, since, limit)
+    return result
+
+
+@app.get("/changes/stream")
+async def stream_changes(request: Request, since: int = Query(0, ge=0)):
+    """変更を Server-Sent Events で流し続ける (再接続時は Last-Event-ID から再開)"""
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        since = int(last_event_id)
+
+    async def events():
+        cursor = since
+        while not await request.is_disconnected():
+            result = await run_db(_read_changes, cursor, CHANGES_MAX_LIMIT)
+            if result["reset"] or result["changes"]:
+                event = "reset" if result["reset"] else "changes"
+                cursor = result["next"]
+                yield f"event: {event}\nid: {cursor}\ndata: ".encode() + orjson.dumps(result) + b"\n\n"
+                continue
+            # 何も無ければ待つ。時間切れならプロキシに切られないようコメント行を送る
+            if not await wait_for_changes(cursor, 15):
+                yield b": keepalive\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.get("/tags/all")
-def get_all_tags():
-    with get_conn() as conn:
-        rows = conn.execute(
-            "SELECT DISTINCT tag FROM video_tags ORDER BY tag COLLATE NOCASE").fetchall()
-    return [r["tag"] for r in rows]
+def get_all_tags(request: Request, with_counts: bool = False, order: str = "name",
+                 limit: int | None = Query(None, ge=1)):
+    # 件数は tag_counts (トリガーで維持) から引くので video_tags は走査しない
+    sql = "SELECT tag, n FROM tag_counts"
+    if order == "-count":
+        sql += " ORDER BY n DESC, tag"
+    else:
+        sql += " ORDER BY tag COLLATE NOCASE"
+    params = []
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+
+    def build():
+        rows = conn.execute(sql, params).fetchall()
+        if with_counts:
+            return [{"tag": r["tag"], "count": r["n"]} for r in rows]
+        return [r["tag"] for r in rows]
+
+    with get_read_conn() as conn:
+        version = library_version(conn)
+        etag = make_etag(version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        body = _response_cache.get_or_build(("tags", with_counts, order, limit), version, build)
+    return json_response(body, etag)
+
+
+@app.get("/stats")
+def get_stats(request: Request, tags: int = Query(STATS_TOP_TAGS, ge=0, le=STATS_MAX_TOP_TAGS),
+              days: int = Query(STATS_DAYS, ge=0, le=STATS_MAX_DAYS)):
+    # トリガーで維持している stats_* / tag_counts を引くだけ (videos / video_tags は集計しない)
+    # 日ごとの追加数は今日までの days 日分なので、日付が変われば書き込みがなくても別の応答になる
+    today = utc_today()
+    with get_read_conn() as conn:
+        version = library_version(conn)
+        etag = make_etag(version, f"-{today:%Y%m%d}")
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        body = _response_cache.get_or_build(("stats", tags, days, today), version,
+                                            lambda: read_stats(conn, tags, days, today))
+    return json_response(body, etag)
 
 
 @app.post("/videos/{id}/note")
@@ -185,4 +511,77 @@ def set_note(id: str, body: NoteIn):
             "UPDATE videos SET note=?, updated_at=datetime('now') WHERE id=?", (body.note, id))
         if cur.rowcount == 0:
             raise HTTPException(404, "video not found")
+    _invalidate()
     return {"ok": True}
+
+
+# ---- まとめて更新 (拡張機能の1操作 = 1リクエスト) ----
+
+def _apply_op(conn, op: BatchOp, metas: dict) -> dict:
+    if op.op == "upsert":
+        meta = metas.get(op.id) or {}
+        conn.execute("""
+        INSERT INTO videos(id, title, thumbnail_url)
+        VALUES(?,?,?)
+        ON CONFLICT(id) DO UPDATE SET
+          title=COALESCE(excluded.title, videos.title),
+          thumbnail_url=COALESCE(excluded.thumbnail_url, videos.thumbnail_url),
+          updated_at=datetime('now')
+        """, (op.id, op.title or meta.get("title"), op.thumbnail_url or meta.get("thumbnail_url")))
+    elif op.op == "rate":
+        if op.rating is None or not (1 <= op.rating <= 5):
+            raise ValueError("rating must be 1..5")
+        conn.execute("""
+        INSERT INTO videos(id, rating) VALUES(?,?)
+        ON CONFLICT(id) DO UPDATE SET rating=excluded.rating, updated_at=datetime('now')
+        """, (op.id, op.rating))
+    elif op.op == "tag_add":
+        if not op.tags:
+            raise ValueError("tags is required")
+        conn.executemany("INSERT OR IGNORE INTO video_tags(video_id, tag) VALUES(?,?)",
+                         [(op.id, t) for t in set(op.tags)])
+        conn.execute("UPDATE videos SET updated_at=datetime('now') WHERE id=?", (op.id,))
+    elif op.op == "tag_remove":
+        if not op.tag:
+            raise ValueError("tag is required")
+        conn.execute("DELETE FROM video_tags WHERE video_id=? AND tag=?", (op.id, op.tag))
+        conn.execute("UPDATE videos SET updated_at=datetime('now') WHERE id=?", (op.id,))
+    elif op.op == "note":
+        cur = conn.execute(
+            "UPDATE videos SET note=?, updated_at=datetime('now') WHERE id=?", (op.note, op.id))
+        if cur.rowcount == 0:
+            raise LookupError("video not found")
+    v = conn.execute("SELECT title FROM videos WHERE id=?", (op.id,)).fetchone()
+    return {"ok": True, "title": v["title"] if v else None}
+
+
+def _apply_batch(ops: list[BatchOp]) -> list[dict]:
+    # タイトル未指定の upsert はキャッシュにあるメタ情報で埋める
+    metas = {op.id: _cached_meta(op.id) for op in ops if op.op == "upsert" and not op.title}
+    results = []
+    with get_conn() as conn:
+        # 全体で1トランザクション。失敗した操作だけセーブポイントまで戻す
+        # (読んでから書く操作もあるので、最初に書き込みロックを取って途中の SQLITE_BUSY を避ける)
+        conn.execute("BEGIN IMMEDIATE")
+        for op in ops:
+            conn.execute("SAVEPOINT batch_op")
+            try:
+                results.append(_apply_op(conn, op, metas))
+            except (ValueError, LookupError, sqlite3.Error) as e:
+                conn.execute("ROLLBACK TO batch_op")
+                results.append({"ok": False, "error": str(e)})
+            conn.execute("RELEASE batch_op")
+        # タイトルがまだ無い動画はワーカーに取りに行かせる
+        ids = list(dict.fromkeys(op.id for op in ops))
+        missing = [r["id"] for r in conn.execute(
+            f"SELECT id FROM videos WHERE title IS NULL AND id IN ({','.join('?' * len(ids))})", ids)]
+        if missing:
+            enqueue_meta(conn, missing)
+    return results
+
+
+@app.post("/batch")
+def batch(body: BatchIn):
+    results = _apply_batch(body.ops)
+    _invalidate()
+    return {"ok": all(r["ok"] for r in results), "results": results}
@@ -0,0 +1,128 @@
+import os
+import threading
+
+# 秒単位のヒストグラムのバケット境界
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 0 より大きければ、これ (ミリ秒) を超えた SQL をログに出す
+SLOW_QUERY_MS = float(os.getenv("FAVTUBE_SLOW_QUERY_MS", "0"))
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {v}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [各バケットの件数..., 合計, 件数]
+        self._values: dict = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            v = self._values.get(labels)
+            if v is None:
+                v = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    v[i] += 1
+                    break
+            v[-2] += value
+            v[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        for labels, v in items:
+            cum = 0
+            for i, b in enumerate(self.buckets):
+                cum += v[i]
+                le = _labels(self.labelnames, labels, 'le="%s"' % b)
+                lines.append(f"{self.name}_bucket{le} {cum}")
+            le = _labels(self.labelnames, labels, 'le="+Inf"')
+            plain = _labels(self.labelnames, labels)
+            lines.append(f"{self.name}_bucket{le} {v[-1]}")
+            lines.append(f"{self.name}_sum{plain} {v[-2]}")
+            lines.append(f"{self.name}_count{plain} {v[-1]}")
+        return lines
+
+
+_metrics: list = []
+_collectors: list = []
+
+
+def register(metric):
+    _metrics.append(metric)
+    return metric
+
+
+def register_collector(fn):
+    """render 時に呼ばれ、[(名前, ヘルプ, 型, [(ラベルdict, 値), ...])] を返す関数を登録"""
+    _collectors.append(fn)
+    return fn
+
+
+def render() -> str:
+    """Prometheus のテキスト形式 (version 0.0.4)"""
+    lines = []
+    for m in _metrics:
+        lines.extend(m.render())
+    for fn in _collectors:
+        for name, help, typ, samples in fn():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {typ}")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(labels.keys(), labels.values())} {value}")
+    return "\n".join(lines) + "\n"
+
+
+http_request_duration = register(Histogram(
+    "favtube_http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status")))
+sql_duration = register(Histogram(
+    "favtube_sql_duration_seconds", "SQLite statement execution time by statement type.", ("op",)))
+youtube_requests = register(Counter(
+    "favtube_youtube_requests_total", "YouTube Data API calls by HTTP status (or 'exception').", ("status",)))
+youtube_duration = register(Histogram(
+    "favtube_youtube_request_duration_seconds", "YouTube Data API call latency.", ("mode",)))
+
+
+def observe_sql(sql: str, seconds: float, op: str | None = None):
+    """op は文の先頭キーワード (SELECT / INSERT / ...) から決める"""
+    if op is None:
+        op = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else "?"
+    sql_duration.observe(seconds, op)
+    if SLOW_QUERY_MS > 0 and seconds * 1000 >= SLOW_QUERY_MS:
+        import logging  # CLI の起動時には読み込まない
+        logging.getLogger("favtube.slow_query").warning("slow query (%.1f ms): %s", seconds * 1000, " ".join(sql.split())[:500])
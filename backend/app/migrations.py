@@ -0,0 +1,213 @@
+"""
+スキーマの版管理 (PRAGMA user_version)
+
+MIGRATIONS[i] が版 i から i+1 への変更。適用済みの版は飛ばす。
+一度リリースしたマイグレーションは書き換えず、変更は新しい版として足すこと。
+トリガーと派生テーブル (全文検索・タグ件数・変更ログ) は db.init_db が毎回 IF NOT EXISTS で作る。
+"""
+import sqlite3
+
+
+def _statements(script: str):
+    """; で区切られた SQL を1文ずつ返す (BEGIN ... END を含むトリガーも分割しない)"""
+    buf = ""
+    for part in script.split(";"):
+        buf += part + ";"
+        if sqlite3.complete_statement(buf):
+            if buf.strip(" \n;"):
+                yield buf.strip()
+            buf = ""
+
+
+def _run(conn, script: str):
+    # executescript は暗黙にコミットしてしまうので、トランザクション内では1文ずつ流す
+    for stmt in _statements(script):
+        conn.execute(stmt)
+
+
+def _v1_baseline(conn):
+    """版管理を入れる前のスキーマ (既存DBでは何もしない)"""
+    _run(conn, """
+    CREATE TABLE IF NOT EXISTS videos (
+        id TEXT PRIMARY KEY,
+        title TEXT,
+        thumbnail_url TEXT,
+        rating INTEGER,
+        note TEXT,
+        created_at TEXT DEFAULT (datetime('now')),
+        updated_at TEXT DEFAULT (datetime('now'))
+    );
+    CREATE TABLE IF NOT EXISTS video_tags (
+        video_id TEXT,
+        tag TEXT,
+        PRIMARY KEY (video_id, tag),
+        FOREIGN KEY (video_id) REFERENCES videos(id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_videos_created ON videos(created_at, id);
+    CREATE INDEX IF NOT EXISTS idx_videos_rating ON videos(IFNULL(rating, 0), id);
+    CREATE INDEX IF NOT EXISTS idx_videos_title ON videos(IFNULL(title, ''), id);
+    CREATE INDEX IF NOT EXISTS idx_video_tags_tag ON video_tags(tag, video_id);
+    CREATE TABLE IF NOT EXISTS youtube_meta_cache (
+        video_id TEXT PRIMARY KEY,
+        title TEXT,
+        thumbnail_url TEXT,
+        found INTEGER NOT NULL,
+        etag TEXT,
+        expires_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS meta_jobs (
+        video_id TEXT PRIMARY KEY,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_run_at REAL NOT NULL,
+        last_error TEXT,
+        created_at TEXT DEFAULT (datetime('now'))
+    );
+    CREATE INDEX IF NOT EXISTS idx_meta_jobs_next ON meta_jobs(next_run_at);
+    CREATE TABLE IF NOT EXISTS thumbnails (
+        video_id TEXT PRIMARY KEY,
+        source_url TEXT NOT NULL,
+        sha256 TEXT NOT NULL,
+        content_type TEXT,
+        fetched_at TEXT DEFAULT (datetime('now'))
+    );
+    CREATE TABLE IF NOT EXISTS library_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO library_state(id, version) VALUES (1, 0);
+    """)
+
+
+def _v2_normalize_tags(conn):
+    """
+    タグを tags(id, name) の辞書に移し、動画とは整数キーで結ぶ
+    videos には整数の主キー pk を足す (既存の rowid をそのまま使うので全文検索の rowid もずれない)
+    video_tags は同じ列を持つビューとして残し、INSERT / DELETE はトリガーで付け替える
+    """
+    _run(conn, """
+    CREATE TABLE videos_v2 (
+        pk INTEGER PRIMARY KEY,
+        id TEXT NOT NULL UNIQUE,
+        title TEXT,
+        thumbnail_url TEXT,
+        rating INTEGER,
+        note TEXT,
+        created_at TEXT DEFAULT (datetime('now')),
+        updated_at TEXT DEFAULT (datetime('now'))
+    );
+    INSERT INTO videos_v2(pk, id, title, thumbnail_url, rating, note, created_at, updated_at)
+    SELECT rowid, id, title, thumbnail_url, rating, note, created_at, updated_at FROM videos;
+
+    CREATE TABLE tags (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    );
+    INSERT INTO tags(name) SELECT DISTINCT tag FROM video_tags WHERE tag IS NOT NULL ORDER BY tag;
+
+    CREATE TABLE video_tag_links (
+        video_pk INTEGER NOT NULL REFERENCES videos(pk) ON DELETE CASCADE,
+        tag_id INTEGER NOT NULL REFERENCES tags(id),
+        PRIMARY KEY (video_pk, tag_id)
+    ) WITHOUT ROWID;
+    INSERT INTO video_tag_links(video_pk, tag_id)
+    SELECT v.pk, t.id FROM video_tags vt
+    JOIN videos_v2 v ON v.id = vt.video_id
+    JOIN tags t ON t.name = vt.tag;
+
+    -- 古いテーブルと一緒にそのトリガー/インデックスも消える (db.init_db が新しいテーブルに張り直す)
+    DROP TABLE video_tags;
+    DROP TABLE videos;
+    ALTER TABLE videos_v2 RENAME TO videos;
+
+    CREATE INDEX idx_videos_created ON videos(created_at, id);
+    CREATE INDEX idx_videos_rating ON videos(IFNULL(rating, 0), id);
+    CREATE INDEX idx_videos_title ON videos(IFNULL(title, ''), id);
+    -- export --since の範囲検索と、メタ未取得の動画の抽出 (refresh-meta --missing-only など)
+    CREATE INDEX idx_videos_updated ON videos(updated_at);
+    CREATE INDEX idx_videos_missing_meta ON videos(pk) WHERE title IS NULL OR thumbnail_url IS NULL;
+    -- タグから動画を引くため (主キーは video_pk 先頭なので使えない)
+    CREATE INDEX idx_video_tag_links_tag ON video_tag_links(tag_id, video_pk);
+
+    CREATE VIEW video_tags AS
+    SELECT v.id AS video_id, t.name AS tag
+    FROM video_tag_links l
+    JOIN videos v ON v.pk = l.video_pk
+    JOIN tags t ON t.id = l.tag_id;
+
+    CREATE TRIGGER video_tags_insert INSTEAD OF INSERT ON video_tags BEGIN
+        -- 元のテーブルの外部キー制約と同じく、存在しない動画へのタグ付けはエラー
+        SELECT RAISE(ABORT, 'FOREIGN KEY constraint failed')
+        WHERE NOT EXISTS (SELECT 1 FROM videos WHERE id = new.video_id);
+        INSERT OR IGNORE INTO tags(name) VALUES (new.tag);
+        INSERT OR IGNORE INTO video_tag_links(video_pk, tag_id)
+        VALUES ((SELECT pk FROM videos WHERE id = new.video_id), (SELECT id FROM tags WHERE name = new.tag));
+    END;
+    CREATE TRIGGER video_tags_delete INSTEAD OF DELETE ON video_tags BEGIN
+        DELETE FROM video_tag_links
+        WHERE video_pk = (SELECT pk FROM videos WHERE id = old.video_id)
+          AND tag_id = (SELECT id FROM tags WHERE name = old.tag);
+    END;
+    """)
+
+
+def _v3_created_index(conn):
+    """
+    作成日時順のインデックスを IFNULL(created_at, '') の式インデックスにする
+    (古いインポートで created_at が NULL の行もキーセットページングで取りこぼさないように)
+    """
+    _run(conn, """
+    DROP INDEX IF EXISTS idx_videos_created;
+    CREATE INDEX idx_videos_created ON videos(IFNULL(created_at, ''), id);
+    """)
+
+
+MIGRATIONS = [
+    _v1_baseline,
+    _v2_normalize_tags,
+    _v3_created_index,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, log=None) -> int:
+    """
+    未適用のマイグレーションを1版ずつ、それぞれ1トランザクションで適用する
+    返却: 適用した版の数
+    例外: RuntimeError (DBの方がアプリより新しい/外部キーの不整合)
+    """
+    version = schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"database schema version {version} is newer than this app supports ({SCHEMA_VERSION})")
+    applied = 0
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        if conn.in_transaction:
+            conn.commit()
+        # テーブルの作り直しで外部キーの連鎖削除が走らないように (トランザクションの外でしか切り替えられない)
+        conn.execute("PRAGMA foreign_keys = OFF")
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # 別プロセスが先に上げていたら何もしない
+            if schema_version(conn) >= target:
+                conn.rollback()
+                continue
+            MIGRATIONS[target - 1](conn)
+            bad = conn.execute("PRAGMA foreign_key_check").fetchall()
+            if bad:
+                raise RuntimeError(f"migration to v{target} left {len(bad)} foreign key violations")
+            conn.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute("PRAGMA foreign_keys = ON")
+        applied += 1
+        if log:
+            log(f"migrated database schema to v{target} ({MIGRATIONS[target - 1].__name__})")
+    return applied
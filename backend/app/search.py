@@ -0,0 +1,197 @@
+import base64
+import json
+import re
+
+# "フレーズ" または空白区切りの単語。末尾の * は前方一致の指定として扱う
+_TERM_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+# trigram トークナイザは3文字未満の語を索引できない
+MIN_MATCH_CHARS = 3
+
+# bm25 の列ごとの重み (title, note, tags)
+BM25_WEIGHTS = (10.0, 1.0, 5.0)
+
+
+def parse_search_terms(query: str) -> list[str]:
+    """検索文字列を語/フレーズのリストに分解"""
+    terms = []
+    for phrase, word in _TERM_RE.findall(query or ""):
+        t = (phrase if phrase else word.rstrip("*")).strip()
+        if t:
+            terms.append(t)
+    return terms
+
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def build_search_filter(query: str):
+    """
+    videos_fts に対する絞り込み条件を組み立てる
+    返却: (WHERE 句の断片, パラメータ, MATCH を使ったか) / 検索語が無ければ None
+    3文字以上の語は FTS5 の MATCH (部分一致・フレーズ一致)、短い語は LIKE で拾う
+    """
+    terms = parse_search_terms(query)
+    if not terms:
+        return None
+    where = []
+    params = []
+    long_terms = [t for t in terms if len(t) >= MIN_MATCH_CHARS]
+    if long_terms:
+        where.append("videos_fts MATCH ?")
+        params.append(" AND ".join(_quote(t) for t in long_terms))
+    for t in terms:
+        if len(t) < MIN_MATCH_CHARS:
+            like = "%" + t.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            where.append("(videos_fts.title LIKE ? ESCAPE '\\' OR videos_fts.note LIKE ? ESCAPE '\\'"
+                         " OR videos_fts.tags LIKE ? ESCAPE '\\')")
+            params.extend([like, like, like])
+    return " AND ".join(where), params, bool(long_terms)
+
+
+def bm25_expr() -> str:
+    return "bm25(videos_fts, " + ", ".join(str(w) for w in BM25_WEIGHTS) + ")"
+
+
+# 一覧で返せる列
+VIDEO_FIELDS = ("id", "title", "thumbnail_url", "rating", "note", "created_at", "updated_at")
+
+# 並び順 -> (ソートキーの式, 方向)。式は migrations.py の複合インデックスと揃えること (NULL はカーソルで比べられないので IFNULL)
+SORT_KEYS = {
+    "-created": ("IFNULL(v.created_at, '')", "DESC"),
+    "-rating": ("IFNULL(v.rating, 0)", "DESC"),
+    "title": ("IFNULL(v.title, '')", "ASC"),
+}
+
+
+def encode_cursor(value) -> str:
+    raw = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """不正なカーソルは ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return json.loads(raw)
+    except Exception:
+        raise ValueError("invalid cursor") from None
+
+
+def parse_fields(fields: str) -> list[str]:
+    """fields=id,title のような指定を検証して返す (id は常に含める)。不明な列は ValueError"""
+    if not fields:
+        return list(VIDEO_FIELDS)
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in names if f not in VIDEO_FIELDS]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}")
+    return ["id"] + [f for f in dict.fromkeys(names) if f != "id"]
+
+
+def _in_list(values) -> str:
+    return ",".join("?" * len(values))
+
+
+def build_tag_filter(tags_all=(), tags_any=(), tags_not=()):
+    """
+    タグの AND / OR / NOT 条件を v.pk に対する WHERE 句の断片にする
+    返却: (断片のリスト, パラメータ)
+    """
+    where = []
+    params: list = []
+    tags_all = list(dict.fromkeys(t for t in tags_all if t))
+    tags_any = list(dict.fromkeys(t for t in tags_any if t))
+    tags_not = list(dict.fromkeys(t for t in tags_not if t))
+    if tags_all:
+        # タグごとに (tag_id, video_pk) インデックスを引いて積集合をとる
+        sub = " INTERSECT ".join(
+            ["SELECT video_pk FROM video_tag_links WHERE tag_id = (SELECT id FROM tags WHERE name = ?)"]
+            * len(tags_all))
+        where.append(f"v.pk IN ({sub})")
+        params.extend(tags_all)
+    if tags_any:
+        where.append("v.pk IN (SELECT l.video_pk FROM video_tag_links l JOIN tags t ON t.id = l.tag_id "
+                     f"WHERE t.name IN ({_in_list(tags_any)}))")
+        params.extend(tags_any)
+    if tags_not:
+        where.append("v.pk NOT IN (SELECT l.video_pk FROM video_tag_links l JOIN tags t ON t.id = l.tag_id "
+                     f"WHERE t.name IN ({_in_list(tags_not)}))")
+        params.extend(tags_not)
+    return where, params
+
+
+def build_list_query(query: str = "", tags_all=(), tags_any=(), tags_not=(), order: str = "-created",
+                     fields: list[str] | None = None, limit: int | None = None, cursor: str | None = None):
+    """
+    動画一覧の SELECT を組み立てる
+    tags_all はすべて持つ (AND)、tags_any はどれかを持つ (OR)、tags_not はどれも持たない (NOT)
+    返却: (sql, params, next_cursor_fn)
+      next_cursor_fn(rows) は最終行から次ページのカーソルを作る (行は列 _k を含む)
+    例外: ValueError (不正なカーソル/並び順)
+    """
+    cols = ", ".join(f"v.{f}" for f in (fields or VIDEO_FIELDS))
+    joins = []
+    where = []
+    params: list = []
+    ranked = False
+    search = build_search_filter(query)
+    if search:
+        frag, search_params, ranked = search
+        joins.append("JOIN videos_fts ON videos_fts.rowid = v.pk")
+        where.append(frag)
+        params.extend(search_params)
+    tag_where, tag_params = build_tag_filter(tags_all, tags_any, tags_not)
+    where.extend(tag_where)
+    params.extend(tag_params)
+
+    if order == "relevance":
+        # 関連度順はキーセットにできないので、カーソルはオフセットを持つ
+        offset = 0
+        if cursor:
+            c = decode_cursor(cursor)
+            if not isinstance(c, dict) or not isinstance(c.get("o"), int):
+                raise ValueError("invalid cursor")
+            offset = c["o"]
+        # 同点の行がページ間で入れ替わらないよう pk で順序を決める
+        order_by = f"{bm25_expr()}, v.pk" if ranked else "IFNULL(v.created_at, '') DESC, v.id DESC"
+        sql = f"SELECT {cols}, NULL AS _k FROM videos v {' '.join(joins)}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {order_by}"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([limit, offset])
+
+        def next_cursor(rows):
+            if limit is None or len(rows) < limit:
+                return None
+            return encode_cursor({"o": offset + len(rows)})
+        return sql, params, next_cursor
+
+    if order not in SORT_KEYS:
+        raise ValueError(f"unknown order: {order}")
+    key, direction = SORT_KEYS[order]
+    if cursor:
+        c = decode_cursor(cursor)
+        if not isinstance(c, list) or len(c) != 2:
+            raise ValueError("invalid cursor")
+        op = "<" if direction == "DESC" else ">"
+        # 行値比較 (a, b) < (?, ?) は式インデックスで範囲検索にならないので展開して書く
+        where.append(f"{key} {op}= ? AND ({key} {op} ? OR v.id {op} ?)")
+        params.extend([c[0], c[0], c[1]])
+    sql = f"SELECT {cols}, {key} AS _k FROM videos v {' '.join(joins)}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {key} {direction}, v.id {direction}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+
+    def next_cursor(rows):
+        if limit is None or len(rows) < limit:
+            return None
+        last = rows[-1]
+        return encode_cursor([last["_k"], last["id"]])
+    return sql, params, next_cursor
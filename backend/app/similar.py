@@ -0,0 +1,241 @@
+"""
+タグの共起にもとづく「似た動画」 (GET /videos/{id}/similar)
+
+動画ごとにタグの TF-IDF 疎ベクトルを作り、コサイン類似度に相手の★の重みを掛けたものをスコアにする。
+上位 TOP_K 件は video_similar に書いておき、エンドポイントはそこを主キーで引くだけにする。
+タグ/★の変更と削除は db.init_db のトリガーが similar_dirty に積み、refresh_similar が
+その動画と、順位が変わりうる動画だけを計算し直す (NumPy / SciPy は計算するときだけ必要)。
+IDF は全件計算のときだけ数え直して similar_idf に保存し、差分更新はそれを使い回す
+(表の中のスコアは常に同じ IDF から計算したものになり、差分更新の結果は全件計算と一致する)。
+"""
+import itertools
+import os
+import threading
+
+from .db import get_conn, get_read_conn, iter_chunks
+
+TOP_K = int(os.getenv("SIMILAR_TOP_K", "20"))
+# API プロセス内で similar_dirty を見に行く間隔 (秒)。0 なら `favtube similar-refresh` だけで更新する
+REFRESH_INTERVAL = float(os.getenv("SIMILAR_REFRESH_INTERVAL", "5"))
+# 変更された動画がこの割合を超えたら差分ではなく全件を計算し直す
+FULL_REBUILD_RATIO = 0.2
+# 一度に類似度を計算する行数 (メモリ使用量はこれに比例する)
+CHUNK_ROWS = 512
+# IN (...) に一度に渡す pk の数 (SQLite の変数の上限より十分小さく)
+SQL_CHUNK = 500
+# ★が無い動画は★3として扱う (★1 -> 0.6 ... ★5 -> 1.0)
+NEUTRAL_RATING = 3
+# video_similar のスコアは小数6桁に丸めて保存しているので、k 位との比較はこの幅だけ緩める
+SCORE_EPS = 1e-6
+
+
+def _numeric():
+    try:
+        import numpy as np
+        import scipy.sparse as sp
+    except ImportError:
+        raise RuntimeError("similar videos require 'numpy' and 'scipy' (pip install numpy scipy)") from None
+    return np, sp
+
+
+def similar_available() -> bool:
+    import importlib.util
+    return all(importlib.util.find_spec(m) is not None for m in ("numpy", "scipy"))
+
+
+def _rows_of(pks, values):
+    """昇順の pks の中で values が何行目か (無いものは除く)"""
+    np, _ = _numeric()
+    values = np.asarray(values, dtype=np.int64)
+    if not len(pks):
+        return values[:0]
+    pos = np.minimum(np.searchsorted(pks, values), len(pks) - 1)
+    return pos[pks[pos] == values]
+
+
+def _idf_base(conn):
+    """前回の全件計算の (動画数, {tag_id: そのタグが付いた動画数})。まだ全件計算していなければ None"""
+    row = conn.execute("SELECT videos FROM similar_state WHERE id = 1").fetchone()
+    if row is None:
+        return None
+    return row[0], {r[0]: r[1] for r in conn.execute(
+        "SELECT t.id, i.df FROM similar_idf i JOIN tags t ON t.name = i.tag")}
+
+
+def _load(conn, base=None):
+    """
+    動画とタグを行列にする
+    base: _idf_base の結果。None なら今の動画とタグから IDF を数える (その後に付いたタグは1件扱い)
+    返却: (pks, X, w, (n, tag_ids, df)) pks は昇順の videos.pk、X は行を L2 正規化した (動画 x タグ) の CSR 行列、
+          w は★の重み、最後は IDF に使った動画数と列ごとの tag_id / タグが付いた動画数
+    """
+    np, sp = _numeric()
+    cur = conn.cursor()
+    cur.row_factory = None
+    videos = np.fromiter(itertools.chain.from_iterable(cur.execute(
+        f"SELECT pk, IFNULL(rating, {NEUTRAL_RATING}) FROM videos ORDER BY pk")), dtype=np.int64).reshape(-1, 2)
+    links = np.fromiter(itertools.chain.from_iterable(cur.execute(
+        "SELECT video_pk, tag_id FROM video_tag_links")), dtype=np.int64).reshape(-1, 2)
+    pks = videos[:, 0]
+    w = 0.5 + videos[:, 1] / 10
+    rows = np.searchsorted(pks, links[:, 0])
+    tag_ids, cols = np.unique(links[:, 1], return_inverse=True)
+    if base is None:
+        n, df = len(pks), np.bincount(cols, minlength=len(tag_ids))
+    else:
+        n, known = base
+        df = np.fromiter((known.get(t, 0) for t in tag_ids.tolist()), dtype=np.int64, count=len(tag_ids))
+    # 多くの動画に付いているタグほど一致しても似ているとは言いにくい
+    idf = np.log1p(n / np.maximum(df, 1))
+    X = sp.csr_matrix((idf[cols], (rows, cols)), shape=(len(pks), len(tag_ids)))
+    norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+    inv = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return pks, (sp.diags(inv) @ X).tocsr(), w, (n, tag_ids, df)
+
+
+def _neighbors(X, XT, w, pks, rows, k: int):
+    """
+    rows (行番号) ごとの上位 k 件を CHUNK_ROWS 行ずつ返す
+    返却: (その回の video_pk のリスト, (video_pk, rank, neighbor_pk, score) のリスト) のイテレータ
+    """
+    np, sp = _numeric()
+    weight = sp.diags(w)
+    for start in range(0, len(rows), CHUNK_ROWS):
+        chunk = rows[start:start + CHUNK_ROWS]
+        S = (X[chunk] @ XT @ weight).tocsr()
+        out = []
+        for i, r in enumerate(chunk):
+            lo, hi = S.indptr[i], S.indptr[i + 1]
+            cols, vals = S.indices[lo:hi], S.data[lo:hi]
+            keep = (cols != r) & (vals > 0)
+            cols, vals = cols[keep], vals[keep]
+            if len(vals) > k:
+                # k 位と同点のものも残してから並べ、同点は pk 順にして結果を決定的にする
+                kth = -np.partition(-vals, k - 1)[k - 1]
+                cols, vals = cols[vals >= kth], vals[vals >= kth]
+            order = np.lexsort((pks[cols], -vals))[:k]
+            src = int(pks[r])
+            out.extend((src, rank, int(pks[c]), round(float(v), 6))
+                       for rank, (c, v) in enumerate(zip(cols[order], vals[order])))
+        yield pks[chunk].tolist(), out
+
+
+def _affected(conn, X, XT, w, pks, dirty, k: int):
+    """差分更新で計算し直す行番号: 変更された動画自身、それを上位に持つ動画、新しいスコアが今の k 位以上の動画"""
+    np, _ = _numeric()
+    d_rows = _rows_of(pks, dirty)
+    out = set(d_rows.tolist())
+    for chunk in iter_chunks(dirty.tolist(), SQL_CHUNK):
+        listing = [r[0] for r in conn.execute(
+            f"SELECT DISTINCT video_pk FROM video_similar WHERE neighbor_pk IN ({','.join('?' * len(chunk))})",
+            chunk)]
+        out.update(_rows_of(pks, listing).tolist())
+    if len(d_rows):
+        # 相手から見た変更後の動画のスコア (重みは変更された側の★)
+        C = (X[d_rows] @ XT).tocoo()
+        best = np.zeros(len(pks))
+        np.maximum.at(best, C.col, C.data * w[d_rows][C.row])
+        cand = np.setdiff1d(np.flatnonzero(best > 0), d_rows)
+        # 上位が k 件に満たない動画は、スコアが正なら必ず入る
+        thr = dict.fromkeys(pks[cand].tolist(), 0.0)
+        for chunk in iter_chunks(thr, SQL_CHUNK):
+            for r in conn.execute(f"""
+            SELECT video_pk, COUNT(*), MIN(score) FROM video_similar
+            WHERE video_pk IN ({','.join('?' * len(chunk))}) GROUP BY video_pk
+            """, chunk):
+                if r[1] >= k:
+                    thr[r[0]] = r[2]
+        limits = np.fromiter(thr.values(), dtype=float, count=len(thr))
+        # k 位と同点なら全件計算と同じく pk 順で入れ替わりうるので、同点も計算し直す
+        out.update(cand[best[cand] >= limits - SCORE_EPS].tolist())
+    return np.array(sorted(out), dtype=np.int64)
+
+
+def refresh_similar(full: bool = False, k: int = TOP_K, keep_idf: bool = False) -> dict:
+    """
+    similar_dirty に積まれた変更を video_similar に反映する
+    読み取り専用の接続で計算し、CHUNK_ROWS 動画ずつ短い書き込みトランザクションで差し替える
+    (動画ごとの上位K件は常にどちらか一方の版がそろって見える)
+    全件計算では IDF も数え直す。keep_idf なら前回の IDF のまま全件を計算し直す (差分更新との突き合わせ用)
+    返却: {"mode": "full" | "incremental" | "noop", "recomputed": 計算し直した動画数, "rows": 書いた行数}
+    例外: RuntimeError (numpy / scipy が無い)
+    """
+    np, _ = _numeric()
+    with get_read_conn() as conn:
+        conn.execute("BEGIN")  # 以下の読み取りを同じスナップショットで
+        max_seq = conn.execute("SELECT IFNULL(MAX(seq), 0) FROM similar_dirty").fetchone()[0]
+        dirty = np.array([r[0] for r in conn.execute(
+            "SELECT video_pk FROM similar_dirty WHERE seq <= ? ORDER BY video_pk", (max_seq,))], dtype=np.int64)
+        base = _idf_base(conn)
+        # 全件計算が途中で止まっていれば similar_state は消えているので、やり直す
+        full = full or base is None
+        if not full and not len(dirty):
+            return {"mode": "noop", "recomputed": 0, "rows": 0}
+        n_videos = conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+        full = full or len(dirty) >= FULL_REBUILD_RATIO * n_videos
+        new_idf = full and not (keep_idf and base is not None)
+        pks, X, w, (n_docs, tag_ids, df) = _load(conn, None if new_idf else base)
+        XT = X.T.tocsr()
+        targets = np.arange(len(pks)) if full else _affected(conn, X, XT, w, pks, dirty, k)
+        if new_idf:
+            names = {r[0]: r[1] for r in conn.execute("SELECT id, name FROM tags")}
+
+    if new_idf:
+        # 書き終わるまでは新旧の IDF の行が混ざるので、終わるまで前回の IDF は無効にしておく
+        with get_conn() as conn:
+            conn.execute("DELETE FROM similar_state")
+
+    n = 0
+    for src, batch in _neighbors(X, XT, w, pks, targets, k):
+        with get_conn() as conn:
+            conn.executemany("DELETE FROM video_similar WHERE video_pk = ?", [(p,) for p in src])
+            # 計算中に削除された動画は載せない
+            conn.executemany("""
+            INSERT INTO video_similar(video_pk, rank, neighbor_pk, score)
+            SELECT ?1, ?2, ?3, ?4
+            WHERE EXISTS (SELECT 1 FROM videos WHERE pk = ?1) AND EXISTS (SELECT 1 FROM videos WHERE pk = ?3)
+            """, batch)
+        n += len(batch)
+    with get_conn() as conn:
+        conn.executemany("DELETE FROM video_similar WHERE video_pk = ?",
+                         [(p,) for p in np.setdiff1d(dirty, pks).tolist()])
+        # 計算中に積まれた分 (seq が大きい) は次回に回す
+        conn.execute("DELETE FROM similar_dirty WHERE seq <= ?", (max_seq,))
+        if new_idf:
+            conn.execute("DELETE FROM similar_idf")
+            conn.executemany("INSERT INTO similar_idf(tag, df) VALUES (?, ?)",
+                             zip((names[t] for t in tag_ids.tolist()), df.tolist()))
+            conn.execute("INSERT INTO similar_state(id, videos) VALUES (1, ?)", (n_docs,))
+    return {"mode": "full" if full else "incremental", "recomputed": len(targets), "rows": n}
+
+
+def pending_similar() -> int:
+    with get_read_conn() as conn:
+        return conn.execute("SELECT COUNT(*) FROM similar_dirty").fetchone()[0]
+
+
+def read_similar(conn, video_id: str, limit: int = TOP_K) -> list | None:
+    """video_similar から上位 limit 件を返す。動画が無ければ None"""
+    v = conn.execute("SELECT pk FROM videos WHERE id=?", (video_id,)).fetchone()
+    if not v:
+        return None
+    return [dict(r) for r in conn.execute("""
+    SELECT n.id, n.title, n.thumbnail_url, n.rating, s.score
+    FROM video_similar s JOIN videos n ON n.pk = s.neighbor_pk
+    WHERE s.video_pk = ? ORDER BY s.rank LIMIT ?
+    """, (v["pk"], limit))]
+
+
+def run_similar_refresher(stop: threading.Event, interval: float = REFRESH_INTERVAL, log=print):
+    """similar_dirty に変更があれば反映する、を stop が立つまで繰り返す"""
+    while not stop.wait(interval):
+        try:
+            if not pending_similar():
+                continue
+            result = refresh_similar()
+        except Exception as e:
+            if log:
+                log(f"similar refresh failed: {e}")
+            continue
+        if log:
+            log(f"similar: {result['mode']} refresh, {result['recomputed']} videos, {result['rows']} rows")
@@ -0,0 +1,50 @@
+"""
+ライブラリの統計 (GET /stats, `favtube stats`)
+
+件数・★の分布・日ごとの追加数は db.init_db のトリガーが stats_* テーブルに積み上げておくので、
+ここでは集計済みの行を引くだけにする (動画やタグが何件あっても videos / video_tags は走査しない)。
+ずれたときは `favtube stats-rebuild` で数え直す。
+"""
+import datetime as dt
+
+# 返すタグの上位件数と、日ごとの追加数をさかのぼる日数の既定値
+TOP_TAGS = 20
+DAYS = 30
+MAX_TOP_TAGS = 500
+MAX_DAYS = 3660
+
+
+def utc_today() -> dt.date:
+    return dt.datetime.now(dt.timezone.utc).date()
+
+
+def read_stats(conn, tags: int = TOP_TAGS, days: int = DAYS, today: dt.date | None = None) -> dict:
+    """
+    集計済みの統計を返す
+    tags: 件数の多いタグを何件返すか / days: today (既定は今日 UTC) を含めて何日分の追加数を返すか (無い日は 0)
+    """
+    t = conn.execute("SELECT videos, rated, rating_sum, tag_links, tags FROM stats_totals WHERE id = 1").fetchone()
+    by_rating = {r["rating"]: r["n"] for r in conn.execute("SELECT rating, n FROM stats_ratings")}
+    top = [{"tag": r["tag"], "count": r["n"]} for r in conn.execute(
+        "SELECT tag, n FROM tag_counts ORDER BY n DESC, tag LIMIT ?", (tags,))] if tags else []
+
+    today = today or utc_today()
+    first = today - dt.timedelta(days=max(days, 1) - 1)
+    added = {r["day"]: r["n"] for r in conn.execute(
+        "SELECT day, n FROM stats_daily WHERE day >= ? ORDER BY day", (first.isoformat(),))} if days else {}
+    per_day = [{"day": d.isoformat(), "count": added.get(d.isoformat(), 0)}
+               for d in (first + dt.timedelta(days=i) for i in range(days))]
+
+    return {
+        "videos": t["videos"],
+        "rated": t["rated"],
+        "unrated": t["videos"] - t["rated"],
+        "rating_avg": round(t["rating_sum"] / t["rated"], 3) if t["rated"] else None,
+        # ★1〜5 は 0 件でも返す (範囲外の値がインポートされていればそれも)
+        "ratings": [{"rating": k, "count": by_rating.get(k, 0)}
+                    for k in sorted(set(range(1, 6)) | by_rating.keys() - {0})],
+        "tags": t["tags"],
+        "tag_links": t["tag_links"],
+        "top_tags": top,
+        "added_per_day": per_day,
+    }
@@ -0,0 +1,186 @@
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+from .db import get_conn, get_read_conn
+
+# サムネイルのローカルキャッシュ。原本は sha256 で名前を付けて1度だけ保存し (同じ画像は共有)、
+# 幅ごとの WebP を横に置く: {THUMBS_DIR}/ab/abcd... と {THUMBS_DIR}/ab/abcd...-320.webp
+THUMBS_DIR = Path(os.getenv("FAVTUBE_THUMBS_DIR", "./thumbs"))
+WIDTHS = (120, 320, 480, 1280)
+WEBP_QUALITY = int(os.getenv("FAVTUBE_THUMBS_QUALITY", "80"))
+# /thumbs/{id} の URL は画像が差し替わっても変わらないので immutable にはしない
+MAX_AGE = int(os.getenv("FAVTUBE_THUMBS_MAX_AGE", str(30 * 24 * 3600)))
+
+_session = requests.Session()
+
+
+def _pil_image():
+    try:
+        from PIL import Image
+    except ImportError:
+        raise RuntimeError("thumbnail resizing requires the 'Pillow' package (pip install Pillow)") from None
+    return Image
+
+
+def pick_width(width: int) -> int:
+    """要求された幅以上で最小の variant (どれより大きければ最大のもの)"""
+    for w in WIDTHS:
+        if w >= width:
+            return w
+    return WIDTHS[-1]
+
+
+def blob_path(sha: str, width: int | None = None) -> Path:
+    name = sha if width is None else f"{sha}-{width}.webp"
+    return THUMBS_DIR / sha[:2] / name
+
+
+def _write_atomic(path: Path, data: bytes):
+    # 同時に同じ画像を書いても、読み手には完全なファイルしか見えないようにする
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def download(url: str, timeout: float = 10) -> tuple[bytes, str | None]:
+    try:
+        resp = _session.get(url, timeout=timeout)
+    except requests.RequestException as e:
+        raise RuntimeError(f"thumbnail download failed: {e!r}") from e
+    if resp.status_code != 200:
+        raise RuntimeError(f"thumbnail download failed: {resp.status_code} {url}")
+    return resp.content, resp.headers.get("Content-Type")
+
+
+def make_variant(sha: str, width: int) -> Path:
+    """
+    原本から幅 width の WebP を作る (原本より大きくはしない)
+    例外: RuntimeError (Pillow が無い/原本が壊れている・画像として読めない)
+    """
+    Image = _pil_image()
+    try:
+        with Image.open(blob_path(sha)) as im:
+            im = im.convert("RGB")
+            im.thumbnail((width, width * 4))
+            buf = io.BytesIO()
+            im.save(buf, "WEBP", quality=WEBP_QUALITY, method=4)
+    except (OSError, Image.DecompressionBombError) as e:
+        # UnidentifiedImageError / 途中で切れた画像も OSError
+        raise RuntimeError(f"thumbnail decode failed: {sha}: {e}") from e
+    out = blob_path(sha, width)
+    _write_atomic(out, buf.getvalue())
+    return out
+
+
+def store_thumbnail(video_id: str, url: str) -> tuple[str, str | None]:
+    """URL の画像を取得して保存し、(sha256, Content-Type) を返す"""
+    data, content_type = download(url)
+    sha = hashlib.sha256(data).hexdigest()
+    if not blob_path(sha).exists():
+        _write_atomic(blob_path(sha), data)
+    with get_conn() as conn:
+        conn.execute("""
+        INSERT INTO thumbnails(video_id, source_url, sha256, content_type) VALUES(?,?,?,?)
+        ON CONFLICT(video_id) DO UPDATE SET
+            source_url=excluded.source_url,
+            sha256=excluded.sha256,
+            content_type=excluded.content_type,
+            fetched_at=datetime('now')
+        """, (video_id, url, sha, content_type))
+    return sha, content_type
+
+
+def ensure_thumbnail(video_id: str) -> tuple[str, str | None] | None:
+    """
+    原本がローカルに無い (または thumbnail_url が変わった) ときだけ取得する
+    返却: (sha256, Content-Type)。動画が無い/サムネURLが無いときは None
+    """
+    with get_read_conn() as conn:
+        row = conn.execute("""
+        SELECT v.thumbnail_url, t.source_url, t.sha256, t.content_type
+        FROM videos v LEFT JOIN thumbnails t ON t.video_id = v.id
+        WHERE v.id = ?
+        """, (video_id,)).fetchone()
+    if row is None or not row["thumbnail_url"]:
+        return None
+    if row["sha256"] and row["source_url"] == row["thumbnail_url"] and blob_path(row["sha256"]).exists():
+        return row["sha256"], row["content_type"]
+    return store_thumbnail(video_id, row["thumbnail_url"])
+
+
+def thumbnail_file(video_id: str, width: int) -> tuple[Path, str, str] | None:
+    """
+    配信するファイルを返す: (パス, media_type, ETag)
+    Pillow が無い環境や原本を画像として読めないときは縮小せずに原本を返す
+    """
+    got = ensure_thumbnail(video_id)
+    if got is None:
+        return None
+    sha, content_type = got
+    w = pick_width(width)
+    path = blob_path(sha, w)
+    if not path.exists():
+        try:
+            path = make_variant(sha, w)
+        except RuntimeError:
+            return blob_path(sha), content_type or "image/jpeg", f'"{sha}"'
+    return path, "image/webp", f'"{sha}-{w}"'
+
+
+def prefetch(ids=None, workers: int = 4, variants: bool = True, progress=None) -> dict:
+    """
+    未取得 (または URL が変わった) サムネイルをまとめて取得する
+    ids を省略すると全件が対象。返却: {"fetched", "failed", "variants"}
+    """
+    sql = """
+    SELECT v.id, v.thumbnail_url FROM videos v LEFT JOIN thumbnails t ON t.video_id = v.id
+    WHERE v.thumbnail_url IS NOT NULL AND (t.sha256 IS NULL OR t.source_url IS NOT v.thumbnail_url)
+    """
+    with get_read_conn() as conn:
+        todo = [(r["id"], r["thumbnail_url"]) for r in conn.execute(sql)]
+    if ids is not None:
+        wanted = set(ids)
+        todo = [t for t in todo if t[0] in wanted]
+
+    make = variants and bool(todo)
+    if make:
+        try:
+            _pil_image()
+        except RuntimeError as e:
+            if progress:
+                progress(f"WARNING: {e}; storing originals only")
+            make = False
+
+    counts = {"fetched": 0, "failed": 0, "variants": 0}
+    lock = threading.Lock()
+
+    def _one(item):
+        vid, url = item
+        try:
+            sha, _ = store_thumbnail(vid, url)
+            n = 0
+            if make:
+                for w in WIDTHS:
+                    if not blob_path(sha, w).exists():
+                        make_variant(sha, w)
+                        n += 1
+        except Exception as e:
+            with lock:
+                counts["failed"] += 1
+            if progress:
+                progress(f"ERROR: {vid}: {e}")
+            return
+        with lock:
+            counts["fetched"] += 1
+            counts["variants"] += n
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        list(ex.map(_one, todo))
+    return counts
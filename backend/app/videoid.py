@@ -0,0 +1,49 @@
+"""
+YouTube の URL / videoId を正規化する (11桁の videoId にそろえる)
+
+対応する形:
+    ID そのもの, youtu.be/ID, (www. / m. / music. / gaming.)youtube.com/watch?...&v=ID...,
+    youtube.com/(shorts|embed|live|v|e)/ID, youtube-nocookie.com/embed/ID
+スキームは省略可。プレイリストや再生位置 (list=, index=, t=) などのパラメータは無視する。
+embed/videoseries?list=... (プレイリストの埋め込み) と embed/live_stream?channel=... は11文字でも ID ではない。
+拡張機能 (content.ts の VIDEO_URL_RE / background.ts の YOUTUBE_URL_RE) も同じ正規表現を使うこと
+(backend/tests/test_videoid.py で3つが同じ結果になることを確かめている)。
+"""
+import os
+import re
+from functools import lru_cache
+
+URL_CACHE_SIZE = int(os.getenv("VIDEO_ID_CACHE_SIZE", "65536"))
+
+_ID = r"[A-Za-z0-9_-]{11}"
+# 1回の match で取り出せるように全形式を1つの正規表現にまとめる (ID の直後は区切り文字か末尾)
+_URL_RE = re.compile(rf"""
+    \s*(?:
+        (?P<bare>{_ID})
+      | (?:https?:)?(?://)?(?:
+            (?:www\.|m\.)?youtu\.be/(?P<short>{_ID})
+          | (?:[a-z0-9-]+\.)*(?:youtube\.com|youtube-nocookie\.com)(?::\d+)?(?:
+                /(?:shorts|embed|live|v|e)/(?!videoseries|live_stream)(?P<path>{_ID})
+              | /(?:watch/?)?\?(?:[^#\s]*?&)?v=(?P<query>{_ID})
+            )
+        )(?:[?&#/]\S*)?
+    )\s*
+""", re.VERBOSE | re.IGNORECASE)
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def canonical_video_id(url: str) -> str | None:
+    """URL または videoId から 11桁の videoId を返す。取り出せなければ None"""
+    m = _URL_RE.fullmatch(url)
+    if m is None:
+        return None
+    return m.group("bare") or m.group("short") or m.group("path") or m.group("query")
+
+
+def resolve_ids(urls) -> tuple[list[str | None], list[str]]:
+    """
+    URL の並びを videoId にする
+    返却: (URL ごとの videoId (取り出せなければ None), 重複と None を除いて出現順に並べたもの)
+    """
+    ids = list(map(canonical_video_id, urls))
+    return ids, list(dict.fromkeys(v for v in ids if v))
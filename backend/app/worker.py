@@ -0,0 +1,133 @@
+import os
+import random
+import threading
+import time
+
+from .db import get_conn, get_read_conn
+from .youtube import BATCH_SIZE, fetch_video_meta_batch
+
+# YouTube への問い合わせ (バッチ1回 = 1トークン) の毎秒レートとバースト
+WORKER_RATE = float(os.getenv("WORKER_RATE", "2"))
+WORKER_BURST = int(os.getenv("WORKER_BURST", "5"))
+# 失敗時の再試行 (指数バックオフ)
+MAX_ATTEMPTS = int(os.getenv("WORKER_MAX_ATTEMPTS", "8"))
+BACKOFF_BASE = float(os.getenv("WORKER_BACKOFF_BASE", "30"))
+BACKOFF_MAX = float(os.getenv("WORKER_BACKOFF_MAX", str(6 * 3600)))
+# 取り出したジョブを他のワーカーに渡さない時間 (処理中に落ちたらこの後に再実行される)
+LEASE_SECONDS = 120
+
+
+class TokenBucket:
+    """rate 個/秒で補充され、最大 capacity 個まで貯まるトークンバケット"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, stop: threading.Event | None = None) -> bool:
+        """トークンが取れるまで待つ。stop が立ったら False"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if stop is not None:
+                if stop.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+
+def enqueue_meta(conn, video_ids) -> int:
+    """メタ取得ジョブを積む。同じIDのジョブが既にあればまとめる (追加しない)"""
+    now = time.time()
+    cur = conn.executemany(
+        "INSERT INTO meta_jobs(video_id, next_run_at) VALUES(?, ?) ON CONFLICT(video_id) DO NOTHING",
+        [(vid, now) for vid in dict.fromkeys(video_ids)])
+    return cur.rowcount
+
+
+def claim_jobs(limit: int = BATCH_SIZE) -> list:
+    """実行時刻が来たジョブを取り出し、リース期間だけ他から見えなくする"""
+    now = time.time()
+    with get_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            "SELECT video_id, attempts FROM meta_jobs WHERE next_run_at <= ? ORDER BY next_run_at LIMIT ?",
+            (now, limit)).fetchall()
+        conn.executemany("UPDATE meta_jobs SET next_run_at=? WHERE video_id=?",
+                         [(now + LEASE_SECONDS, r["video_id"]) for r in rows])
+    return [(r["video_id"], r["attempts"]) for r in rows]
+
+
+def _backoff(attempts: int) -> float:
+    return min(BACKOFF_BASE * (2 ** attempts), BACKOFF_MAX) * random.uniform(0.5, 1.5)
+
+
+def process_jobs(jobs) -> dict:
+    """取り出したジョブを1回のバッチ問い合わせで処理する"""
+    ids = [vid for vid, _ in jobs]
+    try:
+        metas = fetch_video_meta_batch(ids, max_workers=1)
+    except Exception as e:
+        now = time.time()
+        with get_conn() as conn:
+            # 上限回数に達したものは諦める
+            conn.executemany("DELETE FROM meta_jobs WHERE video_id=?",
+                             [(vid,) for vid, attempts in jobs if attempts + 1 >= MAX_ATTEMPTS])
+            conn.executemany(
+                "UPDATE meta_jobs SET attempts=?, next_run_at=?, last_error=? WHERE video_id=?",
+                [(attempts + 1, now + _backoff(attempts), str(e)[:500], vid)
+                 for vid, attempts in jobs if attempts + 1 < MAX_ATTEMPTS])
+        return {"fetched": 0, "failed": len(ids)}
+    with get_conn() as conn:
+        # 登録済みの動画だけ更新する (処理待ちの間に削除されたものは作り直さない)
+        conn.executemany("""
+        UPDATE videos SET
+            title=COALESCE(:title, title),
+            thumbnail_url=COALESCE(:thumbnail_url, thumbnail_url),
+            updated_at=datetime('now')
+        WHERE id=:id AND (title IS NOT COALESCE(:title, title)
+                          OR thumbnail_url IS NOT COALESCE(:thumbnail_url, thumbnail_url))
+        """, list(metas.values()))
+        # NotFound はネガティブキャッシュに載っているので、ジョブとしては完了扱い
+        conn.executemany("DELETE FROM meta_jobs WHERE video_id=?", [(vid,) for vid in ids])
+    return {"fetched": len(metas), "failed": 0}
+
+
+def pending_jobs() -> int:
+    with get_read_conn() as conn:
+        return conn.execute("SELECT COUNT(*) FROM meta_jobs").fetchone()[0]
+
+
+def run_worker(stop: threading.Event | None = None, once: bool = False,
+               rate: float = WORKER_RATE, burst: int = WORKER_BURST, poll_interval: float = 1.0,
+               log=print):
+    """
+    メタ取得ジョブを処理し続ける (stop が立つまで)
+    once=True なら実行可能なジョブが無くなった時点で終わる
+    """
+    stop = stop or threading.Event()
+    bucket = TokenBucket(rate, burst)
+    while not stop.is_set():
+        jobs = claim_jobs()
+        if not jobs:
+            if once:
+                return
+            stop.wait(poll_interval)
+            continue
+        if not bucket.acquire(stop):
+            return
+        result = process_jobs(jobs)
+        if log:
+            log(f"meta jobs: {len(jobs)} processed, fetched={result['fetched']} failed={result['failed']}")
@@ -1,93 +1,350 @@
 import os
-import re
+import threading
+import time
+import asyncio
+import httpx
 import requests
-from urllib.parse import urlparse, parse_qs
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 from pathlib import Path
 
+from .db import get_conn, get_read_conn, run_db
+from .metrics import youtube_duration, youtube_requests
+from .videoid import canonical_video_id
+
 env_path = Path(__file__).resolve().parents[2] / ".env"  # app -> backend -> プロジェクトルート
 load_dotenv(dotenv_path=str(env_path))
 
 YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
+# テスト時はローカルのスタブサーバーに向けられるようにする
+YOUTUBE_API_BASE = os.getenv("YOUTUBE_API_BASE", "https://www.googleapis.com/youtube/v3").rstrip("/")
+
+# videos.list が1回で受け付けるIDの上限
+BATCH_SIZE = 50
+BATCH_WORKERS = int(os.getenv("YOUTUBE_BATCH_WORKERS", "4"))
+
+# 接続を使い回すための共有セッション (keep-alive / コネクションプール)
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=BATCH_WORKERS * 2))
+_session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=BATCH_WORKERS * 2))
+
+# 非同期エンドポイント用の共有クライアント (初回利用時に作る)
+_async_client: httpx.AsyncClient | None = None
+
+# メタ情報キャッシュの有効期限 (秒)。NotFound は短めに持つ
+CACHE_TTL = float(os.getenv("YOUTUBE_CACHE_TTL", str(7 * 24 * 3600)))
+NEGATIVE_CACHE_TTL = float(os.getenv("YOUTUBE_NEGATIVE_CACHE_TTL", "3600"))
+CACHE_SIZE = int(os.getenv("YOUTUBE_CACHE_SIZE", "4096"))
+
+# URL の解析は videoid.py に一本化した (以前の名前でも呼べるように残す)
+parse_video_id_from_url = canonical_video_id
+
+
+def _pick_thumbnail(thumbs: dict) -> str | None:
+    # available の中から最大サイズっぽいものを選ぶ
+    order = ["maxres", "standard", "high", "medium", "default"]
+    for k in order:
+        if k in thumbs and "url" in thumbs[k]:
+            return thumbs[k]["url"]
+    return None
+
 
-_VIDEO_ID_RE = re.compile(r"^[A-Za-z0-9_-]{11}$")
+def _meta_from_item(item: dict) -> dict:
+    snip = item.get("snippet", {})
+    return {
+        "id": item.get("id"),
+        "title": snip.get("title"),
+        "thumbnail_url": _pick_thumbnail(snip.get("thumbnails", {}) or {}),
+    }
 
 
-def parse_video_id_from_url(url: str) -> str | None:
+def _videos_params(video_ids: list[str]) -> dict:
+    if not YOUTUBE_API_KEY:
+        raise RuntimeError("YOUTUBE_API_KEY is not set in environment.")
+    return {
+        "id": ",".join(video_ids),
+        "part": "snippet",
+        "key": YOUTUBE_API_KEY,
+        "maxResults": BATCH_SIZE,
+        "fields": "etag,items(id,snippet(title,thumbnails))",
+    }
+
+
+def _parse_videos_response(status_code: int, headers, text: str, json_fn, etag: str | None):
+    if status_code == 304:
+        return None, etag
+    if status_code != 200:
+        raise RuntimeError(f"Youtube API error: {status_code} {text[:200]}")
+    data = json_fn()
+    items = data.get("items", [])
+    metas = {it["id"]: _meta_from_item(it) for it in items if it.get("id")}
+    return metas, headers.get("ETag") or data.get("etag")
+
+
+def _request_videos(video_ids: list[str], timeout: float = 10, etag: str | None = None):
     """
-    対応: https://www.youtube.com/watch?v=ID, youtu.be/ID, youtube.com/shorts/ID
-    戻り値: 11桁のvideoId or None
+    videos.list を1回呼び出す (最大 BATCH_SIZE 件)
+    返却: ({videoId: meta}, ETag)。見つからなかったIDは含まれない。
+          etag を渡して 304 が返った場合は (None, etag)
+    例外: RuntimeError (キー未設定/HTTPエラー/接続エラー・タイムアウト)
     """
+    params = _videos_params(video_ids)
+    headers = {"If-None-Match": etag} if etag else None
+    t0 = time.perf_counter()
     try:
-        u = urlparse(url)
-        host = (u.netloc or "").lower()
-        if "youtu.be" in host:
-            vid = u.path.lstrip("/")
-            return vid if _VIDEO_ID_RE.match(vid) else None
-        if "youtube.com" in host or "music.youtube.com" in host:
-            # /watch?v=ID
-            qs = parse_qs(u.query)
-            if "v" in qs:
-                vid = qs["v"][0]
-                return vid if _VIDEO_ID_RE.match(vid) else None
-            parts = [p for p in u.path.split("/") if p]
-            if len(parts) >= 2 and parts[0] in ("shorts", "embed", "live"):
-                vid = parts[1]
-                return vid if _VIDEO_ID_RE.match(vid) else None
-        # すでに videoId だけが来た場合にも対応
-        if _VIDEO_ID_RE.match(url.strip()):
-            return url.strip()
-    except Exception:
+        resp = _session.get(f"{YOUTUBE_API_BASE}/videos", params=params, headers=headers, timeout=timeout)
+    except requests.RequestException as e:
+        youtube_requests.inc("exception")
+        # requests の例外は URL (API キー入り) を含むので型名だけ出す
+        raise RuntimeError(f"Youtube API error: {type(e).__name__}") from e
+    finally:
+        youtube_duration.observe(time.perf_counter() - t0, "sync")
+    youtube_requests.inc(str(resp.status_code))
+    return _parse_videos_response(resp.status_code, resp.headers, resp.text, resp.json, etag)
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            timeout=10,
+            limits=httpx.Limits(max_connections=BATCH_WORKERS * 4, max_keepalive_connections=BATCH_WORKERS * 2),
+        )
+    return _async_client
+
+
+async def aclose_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+async def _request_videos_async(video_ids: list[str], timeout: float = 10, etag: str | None = None):
+    """_request_videos の非同期版 (共有 httpx.AsyncClient を使う)"""
+    params = _videos_params(video_ids)
+    headers = {"If-None-Match": etag} if etag else None
+    t0 = time.perf_counter()
+    try:
+        resp = await _get_async_client().get(
+            f"{YOUTUBE_API_BASE}/videos", params=params, headers=headers, timeout=timeout)
+    except httpx.HTTPError as e:
+        youtube_requests.inc("exception")
+        raise RuntimeError(f"Youtube API error: {e!r}") from e
+    finally:
+        youtube_duration.observe(time.perf_counter() - t0, "async")
+    youtube_requests.inc(str(resp.status_code))
+    return _parse_videos_response(resp.status_code, resp.headers, resp.text, resp.json, etag)
+
+
+# ---- メタ情報キャッシュ (プロセス内LRU + SQLite) ----
+
+class _LRUCache:
+    """スレッドセーフな単純LRU。値は (meta | None, etag, expires_at)"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_lru = _LRUCache(CACHE_SIZE)
+
+
+def _cache_lookup(video_ids) -> dict:
+    """キャッシュから (期限切れも含めて) エントリを引く。LRU → SQLite の順"""
+    found = {}
+    misses = []
+    for vid in video_ids:
+        entry = _lru.get(vid)
+        if entry is None:
+            misses.append(vid)
+        else:
+            found[vid] = entry
+    # SQLite の変数上限を超えないよう分割して引く
+    for i in range(0, len(misses), 500):
+        chunk = misses[i:i + 500]
+        with get_read_conn() as conn:
+            rows = conn.execute(
+                f"SELECT * FROM youtube_meta_cache WHERE video_id IN ({','.join('?' * len(chunk))})",
+                chunk).fetchall()
+        for r in rows:
+            meta = None
+            if r["found"]:
+                meta = {"id": r["video_id"], "title": r["title"], "thumbnail_url": r["thumbnail_url"]}
+            entry = (meta, r["etag"], r["expires_at"])
+            _lru.put(r["video_id"], entry)
+            found[r["video_id"]] = entry
+    return found
+
+
+def _cache_store(results: dict):
+    """{videoId: (meta | None, etag)} をキャッシュに書き込む。meta=None は NotFound として短期保存"""
+    if not results:
+        return
+    now = time.time()
+    rows = []
+    for vid, (meta, etag) in results.items():
+        expires_at = now + (CACHE_TTL if meta else NEGATIVE_CACHE_TTL)
+        _lru.put(vid, (meta, etag, expires_at))
+        rows.append((vid, meta["title"] if meta else None, meta["thumbnail_url"] if meta else None,
+                     1 if meta else 0, etag, expires_at))
+    with get_conn() as conn:
+        conn.executemany("""
+        INSERT INTO youtube_meta_cache(video_id, title, thumbnail_url, found, etag, expires_at)
+        VALUES(?,?,?,?,?,?)
+        ON CONFLICT(video_id) DO UPDATE SET
+            title=excluded.title,
+            thumbnail_url=excluded.thumbnail_url,
+            found=excluded.found,
+            etag=excluded.etag,
+            expires_at=excluded.expires_at
+        """, rows)
+
+
+def cached_video_meta(video_id: str):
+    """
+    ネットワークに出ずにキャッシュだけを見る
+    返却: None (キャッシュなし) / (meta | None, 有効期限内か)
+    """
+    entry = _cache_lookup([video_id]).get(video_id)
+    if entry is None:
         return None
-    return None
+    return entry[0], entry[2] > time.time()
 
 
-def fetch_video_meta(video_id: str) -> dict:
+def get_video_meta(video_id: str, refresh: bool = False) -> dict | None:
+    """
+    キャッシュ経由でメタ情報を取得。NotFound の場合は None
+    期限切れのエントリは ETag (If-None-Match) で再検証する
+    例外: RuntimeError (キー未設定/HTTPエラー)
     """
-    Youtube Data API でタイトルとサムネURLを取得
+    entry = _cache_lookup([video_id]).get(video_id)
+    if entry and not refresh and entry[2] > time.time():
+        return entry[0]
+    etag = entry[1] if entry and entry[0] else None
+    metas, new_etag = _request_videos([video_id], etag=etag)
+    if metas is None:
+        # 304 Not Modified: 中身はそのまま、期限だけ延ばす
+        meta = entry[0]
+    else:
+        meta = metas.get(video_id)
+    _cache_store({video_id: (meta, new_etag)})
+    return meta
+
+
+def fetch_video_meta(video_id: str, refresh: bool = False) -> dict:
+    """
+    Youtube Data API でタイトルとサムネURLを取得 (キャッシュ経由)
     返却: {"id": ..., "title": ..., "thumbnail_url": ...}
     例外: RuntimeError (キー未設定/HTTPエラー/NotFound)
     """
-    if not YOUTUBE_API_KEY:
-        raise RuntimeError("YOUTUBE_API_KEY is not set in environment.")
-    endpoint = "https://www.googleapis.com/youtube/v3/videos"
-    params = {
-        "id": video_id,
-        "part": "snippet",
-        "key": YOUTUBE_API_KEY,
-        "maxWidth": 1280,
-    }
-    resp = requests.get(endpoint, params=params, timeout=10)
-    if resp.status_code != 200:
-        raise RuntimeError(f"Youtube API error: {resp.status_code} {resp.text[:200]}")
-    data = resp.json()
-    items = data.get("items", [])
-    if not items:
+    meta = get_video_meta(video_id, refresh=refresh)
+    if meta is None:
         raise RuntimeError("Video not found or not accessible.")
-    snip = items[0].get("snippet", {})
-    thumbs = snip.get("thumbnails", {}) or {}
-    # available の中から最大サイズっぽいものを選ぶ
-    order = ["maxres", "standard", "high", "medium", "default"]
-    thumb_url = None
-    for k in order:
-        if k in thumbs and "url" in thumbs[k]:
-            thumb_url = thumbs[k]["url"]
-            break
-    return {
-        "id": video_id,
-        "title": snip.get("title"),
-        "thumbnail_url": thumb_url,
-    }
+    return meta
 
 
-def fetch_youtube_title(video_id: str) -> str | None:
-    """YouTube Data APIを使って動画タイトルを取得"""
-    try:
-        url = f"https://www.googleapis.com/youtube/v3/videos?part=snippet&id={video_id}&key={YOUTUBE_API_KEY}"
-        res = requests.get(url, timeout=5)
-        data = res.json()
-        if "items" in data and len(data["items"]) > 0:
-            return data["items"][0]["snippet"]["title"]
-    except Exception as e:
-        print("YouTube API error:", e)
-    return None
+def _fetch_chunk(video_ids: list[str]) -> dict:
+    metas, _ = _request_videos(video_ids)
+    # バッチ応答の ETag は個々のIDの再検証には使えないので保存しない
+    return {vid: (metas.get(vid), None) for vid in video_ids}
+
+
+def fetch_video_meta_batch(video_ids, max_workers: int = BATCH_WORKERS, refresh: bool = False) -> dict[str, dict]:
+    """
+    複数IDのメタ情報を BATCH_SIZE 件ずつまとめて取得 (バッチは並列に投げる)
+    キャッシュが有効なIDは問い合わせない (refresh=True なら全件問い合わせる)
+    返却: {videoId: meta} (見つからなかったIDは含まれない)
+    例外: RuntimeError (キー未設定/HTTPエラー)
+    """
+    ids = list(dict.fromkeys(video_ids))  # 重複除去 (順序は維持)
+    result: dict[str, dict] = {}
+    if not refresh:
+        now = time.time()
+        fresh = {vid: e[0] for vid, e in _cache_lookup(ids).items() if e[2] > now}
+        result.update({vid: meta for vid, meta in fresh.items() if meta})
+        ids = [vid for vid in ids if vid not in fresh]
+    chunks = [ids[i:i + BATCH_SIZE] for i in range(0, len(ids), BATCH_SIZE)]
+    if not chunks:
+        return result
+    fetched: dict = {}
+    if len(chunks) == 1 or max_workers <= 1:
+        for c in chunks:
+            fetched.update(_fetch_chunk(c))
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as ex:
+            for part in ex.map(_fetch_chunk, chunks):
+                fetched.update(part)
+    _cache_store(fetched)
+    result.update({vid: meta for vid, (meta, _etag) in fetched.items() if meta})
+    return result
+
+
+# ---- 非同期版 (FastAPI の async エンドポイント用) ----
+
+async def _cache_lookup_async(video_ids) -> dict:
+    """LRU ヒットはその場で返し、SQLite を引くときだけDB用スレッドに回す"""
+    found = {}
+    misses = []
+    for vid in video_ids:
+        entry = _lru.get(vid)
+        if entry is None:
+            misses.append(vid)
+        else:
+            found[vid] = entry
+    if misses:
+        found.update(await run_db(_cache_lookup, misses))
+    return found
+
+
+async def _fetch_chunk_async(video_ids: list[str]) -> dict:
+    metas, _ = await _request_videos_async(video_ids)
+    return {vid: (metas.get(vid), None) for vid in video_ids}
+
+
+async def fetch_video_meta_batch_async(video_ids, refresh: bool = False) -> dict[str, dict]:
+    """fetch_video_meta_batch の非同期版 (バッチは同時に投げる)"""
+    ids = list(dict.fromkeys(video_ids))
+    result: dict[str, dict] = {}
+    if not refresh:
+        now = time.time()
+        fresh = {vid: e[0] for vid, e in (await _cache_lookup_async(ids)).items() if e[2] > now}
+        result.update({vid: meta for vid, meta in fresh.items() if meta})
+        ids = [vid for vid in ids if vid not in fresh]
+    chunks = [ids[i:i + BATCH_SIZE] for i in range(0, len(ids), BATCH_SIZE)]
+    if not chunks:
+        return result
+    # 同時実行数は BATCH_WORKERS まで
+    sem = asyncio.Semaphore(BATCH_WORKERS)
+
+    async def _one(c):
+        async with sem:
+            return await _fetch_chunk_async(c)
+
+    fetched: dict = {}
+    for part in await asyncio.gather(*(_one(c) for c in chunks)):
+        fetched.update(part)
+    await run_db(_cache_store, fetched)
+    result.update({vid: meta for vid, (meta, _etag) in fetched.items() if meta})
+    return result
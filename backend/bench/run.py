@@ -0,0 +1,278 @@
+"""
+API / CLI のホットパスのベンチマーク
+
+使い方 (リポジトリのルートで):
+    python -m backend.bench.run --sizes 10000 100000 --out bench_results.json
+    python -m backend.bench.run --sizes 10000 --baseline bench_results.json   # 前回との比較
+
+ライブラリの規模ごとに子プロセスを立ち上げ (DB_PATH は import 時に決まるため)、
+合成データの import-csv / export、ASGI 経由の各エンドポイントを計測して JSON に書き出す。
+YouTube はローカルのスタブサーバーに差し替え、add-url -> ワーカー処理と refresh-meta もそれに対して測る。
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import Namespace
+from datetime import datetime, timezone
+from pathlib import Path
+
+from . import synth
+from .stub_youtube import running_stub
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+
+def _percentiles(samples: list[float]) -> dict:
+    q = statistics.quantiles(samples, n=100, method="inclusive")
+    return {
+        "p50_ms": round(q[49] * 1000, 3),
+        "p95_ms": round(q[94] * 1000, 3),
+        "p99_ms": round(q[98] * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+    }
+
+
+def _timed(fn, *args):
+    """CLI コマンドの出力は捨てて経過時間だけを返す"""
+    out = io.StringIO()
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+        fn(*args)
+    return time.perf_counter() - t0
+
+
+def _peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KiB、macOS は byte
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+
+
+async def _bench_api(app, ids: list[str], tags: list[str], n: int, concurrency: int) -> dict:
+    import httpx
+
+    orders = ["-created", "-rating", "title"]
+    words = ["live", "music", "ライブ", "tutorial", "切り抜き", "jazz piano"]
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # 読み取り系を先に、キャッシュを無効化する書き込み系は最後に
+        scenarios = {
+            "list_videos": lambda i: client.get("/videos", params={"limit": 50, "order": orders[i % 3]}),
+            "list_videos_tag": lambda i: client.get("/videos", params={"tag": tags[i % len(tags)], "limit": 50}),
+            "list_videos_query": lambda i: client.get("/videos", params={"query": words[i % len(words)], "limit": 50}),
+            "get_video": lambda i: client.get(f"/videos/{ids[i % len(ids)]}"),
+            "tags_all": lambda i: client.get("/tags/all"),
+            # days を変えてレスポンスキャッシュに当たらないようにし、集計テーブルを引く分を測る
+            "stats": lambda i: client.get("/stats", params={"days": 1 + i % 365}),
+            "add_tags": lambda i: client.post(f"/videos/{ids[i % len(ids)]}/tags", json={"tags": [f"bench{i % 20}"]}),
+        }
+        results = {}
+        for name, call in scenarios.items():
+            for i in range(min(10, n)):
+                (await call(i)).raise_for_status()
+            samples = []
+            for i in range(n):
+                t0 = time.perf_counter()
+                resp = await call(i)
+                samples.append(time.perf_counter() - t0)
+                resp.raise_for_status()
+
+            async def _worker(k):
+                for i in range(k, n, concurrency):
+                    (await call(i)).raise_for_status()
+
+            t0 = time.perf_counter()
+            await asyncio.gather(*(_worker(k) for k in range(concurrency)))
+            elapsed = time.perf_counter() - t0
+            results[name] = {**_percentiles(samples), "throughput_rps": round(n / elapsed, 1)}
+    return results
+
+
+async def _bench_add_url(app, n: int) -> dict:
+    """未登録の動画を URL で追加する (メタ情報はキャッシュに無いのでジョブに積まれる)"""
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        samples = []
+        for i in range(n):
+            t0 = time.perf_counter()
+            resp = await client.post("/videos/add-url", json={"url": f"https://youtu.be/nw{i:09d}"})
+            samples.append(time.perf_counter() - t0)
+            resp.raise_for_status()
+    return _percentiles(samples)
+
+
+def _bench_youtube(app, ids: list[str], n: int, stub) -> dict:
+    """
+    外部 API を通る経路: add-url -> ワーカーでジョブを処理しきるまで、と refresh-meta (どちらもスタブ相手)
+    スタブの応答は一瞬なので、ほぼこちら側 (バッチ化・キャッシュ・DB 書き込み) のコストになる
+    """
+    from backend.app import cli
+    from backend.app.worker import pending_jobs, run_worker
+
+    add_url = asyncio.run(_bench_add_url(app, n))
+    jobs = pending_jobs()
+    calls = stub.calls
+    # レート制限は外して、積まれたジョブを処理しきる時間だけを測る
+    drain_s = _timed(lambda: run_worker(once=True, rate=1e9, burst=1_000_000, log=None))
+    drain_calls = stub.calls - calls
+
+    calls = stub.calls
+    refresh_ids = ids[:1000]
+    refresh_s = _timed(cli.cmd_refresh_meta, Namespace(
+        ids=refresh_ids, missing_only=False, workers=4, use_cache=False))
+    return {
+        "add_url": add_url,
+        "worker_drain": {"jobs": jobs, "left": pending_jobs(), "seconds": round(drain_s, 3),
+                         "jobs_per_s": round(jobs / drain_s, 1) if drain_s else None,
+                         "stub_calls": drain_calls},
+        "refresh_meta": {"ids": len(refresh_ids), "seconds": round(refresh_s, 3),
+                         "ids_per_s": round(len(refresh_ids) / refresh_s, 1) if refresh_s else None,
+                         "stub_calls": stub.calls - calls},
+    }
+
+
+def _run_child(args) -> dict:
+    size = args.child
+    workdir = Path(args.workdir) / f"lib_{size}"
+    shutil.rmtree(workdir, ignore_errors=True)
+    workdir.mkdir(parents=True)
+    csv_dir = workdir / "csv"
+
+    t0 = time.perf_counter()
+    counts = synth.write_csv(csv_dir, size, seed=args.seed)
+    generate_s = time.perf_counter() - t0
+
+    with running_stub() as (base_url, stub):
+        # DB_PATH などは import 時に読まれるので、アプリを import する前に設定する
+        os.environ.update({
+            "DATABASE_URL": f"sqlite:///{workdir / 'bench.db'}",
+            "YOUTUBE_API_BASE": base_url,
+            "YOUTUBE_API_KEY": "bench",
+            "FAVTUBE_INPROCESS_WORKER": "0",
+        })
+        from backend.app import cli
+        from backend.app.db import get_conn
+
+        import_s = _timed(cli.cmd_import_csv, Namespace(dir=str(csv_dir), chunk_size=5000, dry_run=False))
+        export_s = _timed(cli.cmd_export_csv, Namespace(
+            dir=str(workdir / "export"), format="csv", compress="none", since=None))
+
+        with get_conn() as conn:
+            ids = [r["id"] for r in conn.execute("SELECT id FROM videos ORDER BY random() LIMIT 1000")]
+            tags = [r["tag"] for r in conn.execute("SELECT tag FROM tag_counts ORDER BY n DESC LIMIT 50")]
+
+        from backend.app.main import app
+        endpoints = asyncio.run(_bench_api(app, ids, tags, args.requests, args.concurrency))
+        youtube = _bench_youtube(app, ids, args.requests, stub)
+        youtube_calls = stub.calls
+
+    rows = counts["videos"] + counts["video_tags"]
+    return {
+        "size": size,
+        "rows": counts,
+        "generate_s": round(generate_s, 3),
+        "import_csv": {"seconds": round(import_s, 3), "rows_per_s": round(rows / import_s, 1)},
+        "export_csv": {"seconds": round(export_s, 3), "rows_per_s": round(rows / export_s, 1)},
+        "endpoints": endpoints,
+        "youtube": youtube,
+        "youtube_stub_calls": youtube_calls,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _compare(current: dict, baseline: dict):
+    """p95 とスループットの前回比を表示"""
+    base = {r["size"]: r for r in baseline.get("results", [])}
+    for r in current["results"]:
+        b = base.get(r["size"])
+        if not b:
+            continue
+        print(f"--- size={r['size']} (vs {baseline.get('meta', {}).get('git_rev')})")
+        for name, m in r["endpoints"].items():
+            bm = b["endpoints"].get(name)
+            if not bm:
+                continue
+            d95 = (m["p95_ms"] - bm["p95_ms"]) / bm["p95_ms"] * 100 if bm["p95_ms"] else 0.0
+            drps = (m["throughput_rps"] - bm["throughput_rps"]) / bm["throughput_rps"] * 100 if bm["throughput_rps"] else 0.0
+            print(f"  {name:20s} p95 {bm['p95_ms']:8.3f} -> {m['p95_ms']:8.3f} ms ({d95:+.1f}%)  "
+                  f"rps {drps:+.1f}%")
+        yt, byt = r.get("youtube"), b.get("youtube")
+        if yt and byt:
+            print(f"  {'add_url':20s} p95 {byt['add_url']['p95_ms']:8.3f} -> {yt['add_url']['p95_ms']:8.3f} ms")
+            for k in ("worker_drain", "refresh_meta"):
+                print(f"  {k:20s} {byt[k]['seconds']:.3f}s -> {yt[k]['seconds']:.3f}s")
+        for k in ("import_csv", "export_csv"):
+            d = (r[k]["seconds"] - b[k]["seconds"]) / b[k]["seconds"] * 100 if b[k]["seconds"] else 0.0
+            print(f"  {k:20s} {b[k]['seconds']:.3f}s -> {r[k]['seconds']:.3f}s ({d:+.1f}%)")
+
+
+def main():
+    p = argparse.ArgumentParser(prog="favtube-bench")
+    p.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000],
+                   help="合成ライブラリの動画数 (例: 10000 100000 1000000)")
+    p.add_argument("--requests", type=int, default=200, help="エンドポイントごとのリクエスト数")
+    p.add_argument("--concurrency", type=int, default=8, help="スループット計測時の同時リクエスト数")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--workdir", default=None, help="合成DB/CSVの置き場所 (既定: 一時ディレクトリ)")
+    p.add_argument("--out", default="bench_results.json")
+    p.add_argument("--baseline", default=None, help="比較対象の過去の結果JSON")
+    p.add_argument("--child", type=int, default=None, help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(_run_child(args)))
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="favtube-bench-")
+    results = []
+    for size in args.sizes:
+        print(f"benchmarking size={size} ...", file=sys.stderr, flush=True)
+        out = subprocess.run(
+            [sys.executable, "-m", "backend.bench.run", "--child", str(size), "--workdir", workdir,
+             "--requests", str(args.requests), "--concurrency", str(args.concurrency), "--seed", str(args.seed)],
+            cwd=REPO_ROOT, check=True, stdout=subprocess.PIPE, text=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "results": results,
+    }
+    Path(args.out).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Wrote: {args.out}")
+    if args.baseline:
+        _compare(report, json.loads(Path(args.baseline).read_text(encoding="utf-8")))
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+favtube CLI の起動時間のベンチマーク
+
+使い方 (リポジトリのルートで):
+    python -m backend.bench.startup                       # list / get / rate / tag-add を各20回
+    python -m backend.bench.startup --runs 50 --top 15    # import の遅いモジュール上位15件も表示
+    python -m backend.bench.startup --budget-ms 100       # 中央値が予算を超えたら終了コード 1
+
+サブコマンドごとに新しいプロセスで CLI を起動して実時間を測り、
+`python -X importtime` の出力から累積 import 時間の大きいモジュールを集計する。
+ネットワークを使わないコマンドで requests / dotenv が読み込まれていないことも確認する。
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+# ネットワークを使わないコマンドでは読み込まれてはいけないモジュール
+HEAVY_MODULES = ("requests", "dotenv", "urllib3", "charset_normalizer", "httpx", "fastapi", "PIL")
+
+VIDEO_ID = "dQw4w9WgXcQ"
+COMMANDS = {
+    "list": ["list"],
+    "get": ["get", VIDEO_ID],
+    "rate": ["rate", VIDEO_ID, "5"],
+    "tag-add": ["tag-add", VIDEO_ID, "bench"],
+}
+
+
+def _cli(argv: list[str], env: dict, importtime: bool = False) -> subprocess.CompletedProcess:
+    flags = ["-X", "importtime"] if importtime else []
+    return subprocess.run([sys.executable, *flags, "-m", "backend.app.cli", *argv], cwd=REPO_ROOT, env=env,
+                          check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+
+def parse_importtime(stderr: str) -> dict[str, int]:
+    """`-X importtime` の出力を {モジュール名: 累積マイクロ秒} にする"""
+    out = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _self_us, cumulative, name = (p.strip() for p in line[len("import time:"):].split("|"))
+        if cumulative.isdigit():
+            out[name] = int(cumulative)
+    return out
+
+
+def _wall(argv: list[str], env: dict, runs: int) -> list[float]:
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        _cli(argv, env)
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def _wall_python(env: dict, runs: int) -> list[float]:
+    """インタプリタ自体の起動時間 (CLI 固有のコストと切り分けるため)"""
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], env=env, check=True)
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def main():
+    p = argparse.ArgumentParser(prog="favtube-bench-startup")
+    p.add_argument("--runs", type=int, default=20, help="コマンドごとの起動回数")
+    p.add_argument("--top", type=int, default=10, help="表示する import の遅いモジュールの数")
+    p.add_argument("--budget-ms", type=float, default=None, help="中央値がこれを超えたら終了コード 1")
+    args = p.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="favtube-startup-")
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{Path(workdir) / 'startup.db'}"}
+    failed = False
+    try:
+        # 1回目はスキーマ作成が入るので計測の前に済ませておく
+        _cli(["add", VIDEO_ID, "--title", "startup bench"], env)
+        base = statistics.median(_wall_python(env, args.runs))
+        print(f"python -c pass              median {base * 1000:7.1f} ms")
+        for name, argv in COMMANDS.items():
+            samples = _wall(argv, env, args.runs)
+            med = statistics.median(samples)
+            times = parse_importtime(_cli(argv, env, importtime=True).stderr)
+            heavy = [m for m in HEAVY_MODULES if m in times]
+            print(f"{name:26s} median {med * 1000:7.1f} ms  min {min(samples) * 1000:7.1f} ms  "
+                  f"(interpreter +{(med - base) * 1000:.1f} ms)")
+            if heavy:
+                print(f"  WARNING: network modules imported: {', '.join(heavy)}")
+                failed = True
+            if args.budget_ms is not None and med * 1000 > args.budget_ms:
+                print(f"  over budget ({args.budget_ms:.0f} ms)")
+                failed = True
+        if args.top:
+            times = parse_importtime(_cli(COMMANDS["list"], env, importtime=True).stderr)
+            print("--- slowest imports for 'list' (cumulative)")
+            for name, us in sorted(times.items(), key=lambda kv: kv[1], reverse=True)[:args.top]:
+                print(f"  {us / 1000:7.1f} ms  {name}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""YouTube Data API (videos.list) のローカルスタブ。YOUTUBE_API_BASE をこれに向けて使う"""
+import json
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive を効かせる
+
+    def do_GET(self):
+        u = urlparse(self.path)
+        if not u.path.endswith("/videos"):
+            self.send_error(404)
+            return
+        ids = [i for i in parse_qs(u.query).get("id", [""])[0].split(",") if i]
+        self.server.calls += 1
+        self.server.ids_requested += len(ids)
+        # "missing" で始まるIDは存在しない動画として扱う
+        items = [{
+            "id": vid,
+            "snippet": {
+                "title": f"Stub video {vid}",
+                "thumbnails": {"high": {"url": f"https://i.ytimg.com/vi/{vid}/hqdefault.jpg"}},
+            },
+        } for vid in ids if not vid.startswith("missing")]
+        body = json.dumps({"etag": f"stub-{len(items)}", "items": items}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def running_stub(host: str = "127.0.0.1", port: int = 0):
+    """スタブを別スレッドで起動し、API のベースURLを返す"""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.calls = 0
+    server.ids_requested = 0
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    try:
+        yield f"http://{host}:{server.server_address[1]}/youtube/v3", server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    import time
+    with running_stub(port=8765) as (base, _server):
+        print(f"stub YouTube API listening: YOUTUBE_API_BASE={base}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
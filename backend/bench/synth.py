@@ -0,0 +1,84 @@
+"""ベンチマーク用の合成ライブラリ (videos.csv / video_tags.csv) を作る"""
+import bisect
+import csv
+import itertools
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+
+_ID_CHARS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-"
+_WORDS = [
+    "live", "official", "music", "video", "cover", "remix", "tutorial", "review", "gameplay", "vlog",
+    "cooking", "travel", "piano", "guitar", "jazz", "lofi", "anime", "trailer", "highlights", "podcast",
+    "ライブ", "公式", "歌ってみた", "弾いてみた", "料理", "旅行", "実況", "解説", "まとめ", "切り抜き",
+]
+
+
+def video_id(rng: random.Random) -> str:
+    return "".join(rng.choices(_ID_CHARS, k=11))
+
+
+def _zipf_cum_weights(n: int, s: float = 1.1) -> list[float]:
+    return list(itertools.accumulate(1 / (rank ** s) for rank in range(1, n + 1)))
+
+
+def generate(n_videos: int, seed: int = 42):
+    """
+    (videos の行, video_tags の行) を順に返すジェネレータを2つ返す
+    タグは Zipf 分布 (少数の人気タグに偏る)、1動画あたり 0〜8 個
+    """
+    rng = random.Random(seed)
+    n_tags = max(50, n_videos // 50)
+    tag_names = [f"tag{i}" if i % 3 else f"タグ{i}" for i in range(n_tags)]
+    cum = _zipf_cum_weights(n_tags)
+    total = cum[-1]
+    start = datetime(2020, 1, 1)
+    ids = [video_id(rng) for _ in range(n_videos)]
+
+    def videos():
+        r = random.Random(seed + 1)
+        for i, vid in enumerate(ids):
+            created = start + timedelta(seconds=i * 600 + r.randrange(600))
+            yield (
+                vid,
+                " ".join(r.choices(_WORDS, k=r.randint(2, 6))) + f" #{i}",
+                f"https://i.ytimg.com/vi/{vid}/hqdefault.jpg",
+                r.choice(["", "", "1", "2", "3", "3", "4", "4", "5"]),
+                r.choice(["", "", "", "お気に入り", "あとで見る", "great track"]),
+                created.strftime("%Y-%m-%d %H:%M:%S"),
+                created.strftime("%Y-%m-%d %H:%M:%S"),
+            )
+
+    def video_tags():
+        r = random.Random(seed + 2)
+        for vid in ids:
+            k = min(8, int(r.expovariate(1 / 2.5)))
+            picked = {tag_names[bisect.bisect_left(cum, r.random() * total)] for _ in range(k)}
+            for t in sorted(picked):
+                yield (vid, t)
+
+    return videos(), video_tags()
+
+
+def write_csv(outdir: Path, n_videos: int, seed: int = 42) -> dict:
+    """cli の import-csv がそのまま読める形式で書き出す"""
+    outdir.mkdir(parents=True, exist_ok=True)
+    videos, video_tags = generate(n_videos, seed)
+    counts = {}
+    with open(outdir / "videos.csv", "w", newline="", encoding="utf-8-sig") as f:
+        w = csv.writer(f)
+        w.writerow(["id", "title", "thumbnail_url", "rating", "note", "created_at", "updated_at"])
+        n = 0
+        for row in videos:
+            w.writerow(row)
+            n += 1
+        counts["videos"] = n
+    with open(outdir / "video_tags.csv", "w", newline="", encoding="utf-8-sig") as f:
+        w = csv.writer(f)
+        w.writerow(["video_id", "tag"])
+        n = 0
+        for row in video_tags:
+            w.writerow(row)
+            n += 1
+        counts["video_tags"] = n
+    return counts
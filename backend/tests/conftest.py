@@ -0,0 +1,11 @@
+"""
+テスト用の設定 (リポジトリのルートで `python -m pytest backend/tests`)
+
+DB_PATH は backend.app.db の import 時に決まるので、先に一時ファイルの DB を指しておく。
+"""
+import os
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="favtube-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ.setdefault("SIMILAR_TOP_K", "5")
@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+
+from backend.app import similar  # noqa: E402
+from backend.app.db import get_conn, get_read_conn, init_db  # noqa: E402
+
+N_VIDEOS = 300
+TAGS = [f"t{i}" for i in range(40)]
+
+
+@pytest.fixture
+def library():
+    init_db()
+    rnd = random.Random(20)
+    with get_conn() as conn:
+        conn.execute("DELETE FROM videos")
+        for i in range(N_VIDEOS):
+            _add_video(conn, rnd, f"v{i:010d}")
+    similar.refresh_similar(full=True)
+    return rnd
+
+
+def _add_video(conn, rnd, vid):
+    conn.execute("INSERT INTO videos(id, title, rating) VALUES (?, ?, ?)",
+                 (vid, vid, rnd.choice([None, 1, 2, 3, 4, 5])))
+    conn.executemany("INSERT OR IGNORE INTO video_tags(video_id, tag) VALUES (?, ?)",
+                     [(vid, t) for t in rnd.sample(TAGS, rnd.randint(0, 5))])
+
+
+def _edit(conn, rnd, n):
+    """タグの付け外し・★の変更・動画の追加と削除をランダムに n 回"""
+    ids = [r[0] for r in conn.execute("SELECT id FROM videos")]
+    for _ in range(n):
+        vid = rnd.choice(ids)
+        op = rnd.random()
+        if op < 0.35:
+            conn.execute("INSERT OR IGNORE INTO video_tags(video_id, tag) VALUES (?, ?)", (vid, rnd.choice(TAGS)))
+        elif op < 0.6:
+            conn.execute("DELETE FROM video_tags WHERE video_id = ? AND tag = ?", (vid, rnd.choice(TAGS)))
+        elif op < 0.8:
+            conn.execute("UPDATE videos SET rating = ? WHERE id = ?", (rnd.choice([None, 1, 2, 3, 4, 5]), vid))
+        elif op < 0.9:
+            conn.execute("DELETE FROM videos WHERE id = ?", (vid,))
+            ids.remove(vid)
+        else:
+            vid = f"n{rnd.getrandbits(40):010x}"
+            _add_video(conn, rnd, vid)
+            ids.append(vid)
+
+
+def _snapshot():
+    with get_read_conn() as conn:
+        return [tuple(r) for r in conn.execute(
+            "SELECT video_pk, rank, neighbor_pk, score FROM video_similar ORDER BY video_pk, rank")]
+
+
+def test_incremental_matches_full_rebuild(library):
+    rnd = library
+    for _ in range(15):
+        with get_conn() as conn:
+            _edit(conn, rnd, rnd.randint(1, 15))
+        assert similar.refresh_similar()["mode"] in ("incremental", "noop")
+        incremental = _snapshot()
+        # 同じ IDF で全件を計算し直しても変わらない
+        similar.refresh_similar(full=True, keep_idf=True)
+        assert _snapshot() == incremental
+
+
+def test_incremental_keeps_idf_until_full_rebuild(library):
+    with get_read_conn() as conn:
+        before = [tuple(r) for r in conn.execute("SELECT tag, df FROM similar_idf ORDER BY tag")]
+    with get_conn() as conn:
+        _edit(conn, library, 10)
+    similar.refresh_similar()
+    with get_read_conn() as conn:
+        assert [tuple(r) for r in conn.execute("SELECT tag, df FROM similar_idf ORDER BY tag")] == before
+    similar.refresh_similar(full=True)
+    with get_read_conn() as conn:
+        assert [tuple(r) for r in conn.execute("SELECT tag, df FROM similar_idf ORDER BY tag")] == [
+            tuple(r) for r in conn.execute(
+                "SELECT t.name, COUNT(*) FROM video_tag_links l JOIN tags t ON t.id = l.tag_id "
+                "GROUP BY t.name ORDER BY t.name")]
@@ -0,0 +1,66 @@
+import re
+from pathlib import Path
+
+import pytest
+
+from backend.app.videoid import canonical_video_id, resolve_ids
+
+ID = "dQw4w9WgXcQ"
+CASES = [
+    (ID, ID),
+    (f"  {ID}  ", ID),
+    (f"https://www.youtube.com/watch?v={ID}", ID),
+    (f"https://www.youtube.com/watch?list=PL123&index=2&v={ID}&t=30s", ID),
+    (f"youtube.com/watch?v={ID}#t=1", ID),
+    (f"https://m.youtube.com/watch?v={ID}", ID),
+    (f"https://music.youtube.com/watch?v={ID}&feature=share", ID),
+    (f"https://youtu.be/{ID}?t=42", ID),
+    (f"//youtu.be/{ID}", ID),
+    (f"https://www.youtube.com/shorts/{ID}", ID),
+    (f"https://www.youtube.com/embed/{ID}?start=10", ID),
+    (f"https://www.youtube-nocookie.com/embed/{ID}", ID),
+    (f"https://www.youtube.com/live/{ID}?si=abc", ID),
+    (f"https://www.youtube.com/v/{ID}", ID),
+    # プレイリスト / チャンネルのライブの埋め込みは11文字でも ID ではない
+    ("https://www.youtube.com/embed/videoseries?list=PLx0sYbCqOb8TBPRdmBHs5Iftvv9TPboYG", None),
+    ("https://www.youtube-nocookie.com/embed/videoseries?list=PL123", None),
+    ("https://www.youtube.com/embed/live_stream?channel=UC123", None),
+    (f"https://www.youtube.com/watch?v={ID}x", None),
+    (f"https://example.com/watch?v={ID}", None),
+    ("https://www.youtube.com/playlist?list=PL123", None),
+    ("", None),
+]
+
+EXTENSION = Path(__file__).resolve().parents[2] / "extension" / "src"
+JS_PATTERNS = [("content.ts", "VIDEO_URL_RE"), ("background.ts", "YOUTUBE_URL_RE")]
+
+
+def _js_regex(file, name):
+    """拡張機能の正規表現リテラルを Python の re で読む (使っている構文は両方で同じ意味)"""
+    m = re.search(rf"^const {name} = /(.*)/i;$", (EXTENSION / file).read_text(encoding="utf-8"), re.M)
+    assert m, f"{name} not found in {file}"
+    return m.group(1)
+
+
+@pytest.mark.parametrize("url,expected", CASES)
+def test_canonical_video_id(url, expected):
+    assert canonical_video_id(url) == expected
+
+
+@pytest.mark.parametrize("file,name", JS_PATTERNS)
+def test_extension_regex_matches_backend(file, name):
+    js = re.compile(_js_regex(file, name), re.I)
+    for url, expected in CASES:
+        m = js.search(url)
+        assert (next(filter(None, m.groups()), None) if m else None) == expected, url
+
+
+def test_extension_regexes_are_identical():
+    assert len({_js_regex(f, n) for f, n in JS_PATTERNS}) == 1
+
+
+def test_resolve_ids_dedupes_in_order():
+    other = "abcdefghijk"
+    per_url, unique = resolve_ids([f"https://youtu.be/{other}", "nope", ID, f"https://www.youtube.com/watch?v={other}"])
+    assert per_url == [other, None, ID, other]
+    assert unique == [other, ID]
@@ -14,13 +14,12 @@ async function api(path: string, init?: RequestInit) {
   try { return JSON.parse(text); } catch { return {}; }
 }
 
-function extractId(url: string):string{
-    try{
-        const u = new URL(url);
-        if (u.hostname ==="youtu.be") return u.pathname.slice(1);
-        if(u.pathname.startsWith("/shorts/")) return u.pathname.split("/")[2];
-        return u.searchParams.get("v") || "";
-    }catch {return "";}
+// content.ts の VIDEO_URL_RE / backend/app/videoid.py の _URL_RE と同じもの (content script とはスコープを共有するので別名)
+const YOUTUBE_URL_RE = /^\s*(?:([A-Za-z0-9_-]{11})|(?:https?:)?(?:\/\/)?(?:(?:www\.|m\.)?youtu\.be\/([A-Za-z0-9_-]{11})|(?:[a-z0-9-]+\.)*(?:youtube\.com|youtube-nocookie\.com)(?::\d+)?(?:\/(?:shorts|embed|live|v|e)\/(?!videoseries|live_stream)([A-Za-z0-9_-]{11})|\/(?:watch\/?)?\?(?:[^#\s]*?&)?v=([A-Za-z0-9_-]{11})))(?:[?&#\/]\S*)?)\s*$/i;
+
+function extractId(url: string): string | null {
+  const m = YOUTUBE_URL_RE.exec(url);
+  return m ? m[1] || m[2] || m[3] || m[4] : null;
 }
 
 const inflight = new Map<string, Promise<any>>();
@@ -106,24 +105,19 @@ chrome.runtime.onMessage.addListener((msg, sender, sendResponse) => {
       // --- 評価登録 ---
       if (msg.type === "rate") {
         const videoId = msg.id;
-        const url = `https://www.youtube.com/watch?v=${videoId}`;
 
-        // 存在しなければ登録してから評価
-        await fetch("http://localhost:8080/videos/add-url", {
+        // 登録 (なければ) と評価を1リクエスト・1トランザクションで
+        const payload = await api("/batch", {
           method: "POST",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({ url }),
+          body: JSON.stringify({
+            ops: [
+              { op: "upsert", id: videoId },
+              { op: "rate", id: videoId, rating: msg.rating },
+            ],
+          }),
         });
-
-        const res = await fetch(`http://localhost:8080/videos/${videoId}/rating`, {
-          method: "POST",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({ rating: msg.rating }),
-        });
-
-        let payload: any = null;
-        try {payload = await res.json(); }catch {}
-        sendResponse({ ok: res.ok, title: payload?.title || null});
+        const r = payload?.results?.[1];
+        sendResponse({ ok: !!r?.ok, title: r?.title || null, error: r?.error });
 
         return;
       }
@@ -132,17 +126,25 @@ chrome.runtime.onMessage.addListener((msg, sender, sendResponse) => {
       if (msg.type === "tag-add") {
         const videoId = msg.id;
         const tags = msg.tags;
-        await fetch("http://localhost:8080/videos/add-url", {
+        const payload = await api("/batch", {
           method: "POST",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({ url: `https://www.youtube.com/watch?v=${videoId}` }),
+          body: JSON.stringify({
+            ops: [
+              { op: "upsert", id: videoId },
+              { op: "tag_add", id: videoId, tags },
+            ],
+          }),
         });
-        const res = await fetch(`http://localhost:8080/videos/${videoId}/tags`, {
-          method: "POST",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({ tags }),
-        });
-        sendResponse({ ok: res.ok });
+        const r = payload?.results?.[1];
+        sendResponse({ ok: !!r?.ok, error: r?.error });
+        return;
+      }
+
+      // --- 似た動画 (サーバー側で事前計算済みの上位K件) ---
+      if (msg.type === "get-similar") {
+        const res = await fetch(`${API_BASE}/videos/${msg.id}/similar?limit=${msg.limit ?? 10}`);
+        const payload = res.ok ? await res.json() : null;
+        sendResponse({ ok: res.ok, items: payload?.items ?? [], available: payload?.available ?? false });
         return;
       }
 
@@ -1,20 +1,10 @@
 // --- 小ユーティリティ ------------------------------------
+// backend/app/videoid.py の _URL_RE と同じ形式 (watch?v= / youtu.be / shorts / embed / live / v / m. / nocookie / ID のみ) に対応させること
+const VIDEO_URL_RE = /^\s*(?:([A-Za-z0-9_-]{11})|(?:https?:)?(?:\/\/)?(?:(?:www\.|m\.)?youtu\.be\/([A-Za-z0-9_-]{11})|(?:[a-z0-9-]+\.)*(?:youtube\.com|youtube-nocookie\.com)(?::\d+)?(?:\/(?:shorts|embed|live|v|e)\/(?!videoseries|live_stream)([A-Za-z0-9_-]{11})|\/(?:watch\/?)?\?(?:[^#\s]*?&)?v=([A-Za-z0-9_-]{11})))(?:[?&#\/]\S*)?)\s*$/i;
+
 function parseVideoIdFromUrl(href: string): string | null {
-  try {
-    const u = new URL(href);
-    if (u.hostname === "youtu.be") {
-      const vid = u.pathname.slice(1);
-      return /^[A-Za-z0-9_-]{11}$/.test(vid) ? vid : null;
-    }
-    if (u.pathname.startsWith("/shorts/")) {
-      const vid = u.pathname.split("/")[2];
-      return /^[A-Za-z0-9_-]{11}$/.test(vid) ? vid : null;
-    }
-    const vid = u.searchParams.get("v");
-    return vid && /^[A-Za-z0-9_-]{11}$/.test(vid) ? vid : null;
-  } catch {
-    return null;
-  }
+  const m = VIDEO_URL_RE.exec(href);
+  return m ? m[1] || m[2] || m[3] || m[4] : null;
 }
 
 function ensureUIRoot(): HTMLElement {
@@ -44,6 +34,10 @@ function ensureUIRoot(): HTMLElement {
       />
       <ul id="fvt-suggestions" style="margin-top:6px;max-height:120px;overflow:auto;background:#121317;border:1px solid #2a2a2e;border-radius:10px;display:none;padding:6px"></ul>
     </div>
+    <div id="fvt-similar-box" style="margin-top:10px;display:none">
+      <div style="color:#9ca3af">似た動画</div>
+      <ul id="fvt-similar" style="margin:6px 0 0;padding:0;list-style:none;max-height:160px;overflow:auto"></ul>
+    </div>
   `;
   document.body.appendChild(root);
   return root;
@@ -171,6 +165,37 @@ function wireTagInput() {
   };
 }
 
+// 似た動画 (サーバー側で事前計算済み)。1件もなければ欄ごと隠す
+function renderSimilar(items: { id: string; title?: string; rating?: number }[]) {
+  const box = document.getElementById("fvt-similar-box");
+  const el = document.getElementById("fvt-similar");
+  if (!box || !el) return;
+  el.innerHTML = "";
+  items.forEach(v => {
+    const li = document.createElement("li");
+    const a = document.createElement("a");
+    a.href = `https://www.youtube.com/watch?v=${v.id}`;
+    a.textContent = `${v.rating ? "★" + v.rating + " " : ""}${v.title || v.id}`;
+    Object.assign(a.style, {
+      display:"block", padding:"4px 6px", borderRadius:"8px", color:"#e5e7eb",
+      textDecoration:"none", whiteSpace:"nowrap", overflow:"hidden", textOverflow:"ellipsis"
+    } as CSSStyleDeclaration);
+    a.addEventListener("mouseenter", () => a.style.background = "#1e1f26");
+    a.addEventListener("mouseleave", () => a.style.background = "transparent");
+    li.appendChild(a);
+    el.appendChild(li);
+  });
+  box.style.display = items.length ? "block" : "none";
+}
+
+function loadSimilar(id: string) {
+  chrome.runtime.sendMessage({ type: "get-similar", id, limit: 5 }, (res) => {
+    // 別の動画に移った後に返ってきた結果は捨てる
+    if (!res?.ok || current?.id !== id) return;
+    renderSimilar(res.items || []);
+  });
+}
+
 // --- 初期化 & データ取得 ------------------------------------
 function renderInitial(id: string) {
   ensureUIRoot();
@@ -197,6 +222,7 @@ function renderInitial(id: string) {
       setTitle(current.title || "(タイトル不明",true);
       renderStars(current.rating || 0);
       renderTags(current.tags || []);
+      loadSimilar(id);
     } else {
       current = { id, registered: false, rating: 0, tags: [] };
       setTitle("未登録",false);